@@ -4,13 +4,25 @@ Safe, predefined functions for project operations
 """
 
 import os
+import re
 import json
 import asyncio
 from datetime import datetime
+from contextvars import ContextVar
+from functools import lru_cache, wraps
 from asyncio.subprocess import PIPE
+from html import escape
 from pathlib import Path
+from string import Template
+from types import MappingProxyType
 from typing import Dict, List, Optional, Any
 import shutil
+import stat
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
 
 from thinking_python import validate_file_path
 from process_manager import (
@@ -24,6 +36,41 @@ from process_manager import (
 )
 
 
+def _dump(obj: Any) -> str:
+    """Serialize a command result as indented JSON (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(obj, indent=2)
+
+
+# Raw fds must skip Windows text-mode translation (CRLF folding, Ctrl-Z as EOF)
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+# Resolved working directory, computed once per public command call
+_CWD_VAR: ContextVar[Optional[Path]] = ContextVar("oroto_cwd", default=None)
+
+
+def _cwd() -> Path:
+    """Return the resolved working directory for the current command call."""
+    cwd = _CWD_VAR.get()
+    return cwd if cwd is not None else Path.cwd().resolve()
+
+
+def _with_cwd(func):
+    """Resolve the working directory once for a command and its nested calls."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _CWD_VAR.get() is not None:
+            return func(*args, **kwargs)
+        token = _CWD_VAR.set(Path.cwd().resolve())
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _CWD_VAR.reset(token)
+    return wrapper
+
+
+@_with_cwd
 def list_directory(path: str = ".") -> Dict:
     """
     List all files and folders in a directory.
@@ -44,10 +91,11 @@ def list_directory(path: str = ".") -> Dict:
     
     try:
         target_path = Path(path).resolve()
+        cwd = _cwd()
         
         # Security: ensure path is within current working directory
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(cwd)
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
@@ -66,12 +114,12 @@ def list_directory(path: str = ".") -> Dict:
                 result["files"].append({
                     "name": item.name,
                     "size": item.stat().st_size,
-                    "path": str(item.relative_to(Path.cwd()))
+                    "path": str(item.relative_to(cwd))
                 })
             elif item.is_dir():
                 result["folders"].append({
                     "name": item.name,
-                    "path": str(item.relative_to(Path.cwd()))
+                    "path": str(item.relative_to(cwd))
                 })
         
         result["success"] = True
@@ -82,6 +130,7 @@ def list_directory(path: str = ".") -> Dict:
     return result
 
 
+@_with_cwd
 def read_file(file_path: str, max_lines: Optional[int] = None) -> Dict:
     """
     Read the contents of a file.
@@ -107,7 +156,7 @@ def read_file(file_path: str, max_lines: Optional[int] = None) -> Dict:
         
         # Security: ensure path is within current working directory
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
@@ -121,8 +170,8 @@ def read_file(file_path: str, max_lines: Optional[int] = None) -> Dict:
             return result
         
         # Read file
-        with open(target_path, 'r', encoding='utf-8', errors='ignore') as f:
-            if max_lines:
+        if max_lines:
+            with open(target_path, 'r', encoding='utf-8', errors='ignore') as f:
                 lines = []
                 for i, line in enumerate(f):
                     if i >= max_lines:
@@ -130,8 +179,25 @@ def read_file(file_path: str, max_lines: Optional[int] = None) -> Dict:
                         break
                     lines.append(line.rstrip('\n'))
                 result["content"] = '\n'.join(lines)
-            else:
-                result["content"] = f.read()
+        else:
+            # Whole-file read: one raw read sized from fstat, decoded once
+            fd = os.open(target_path, os.O_RDONLY | _O_BINARY)
+            try:
+                size = os.fstat(fd).st_size
+                data = os.read(fd, size)
+                # Short reads (or files growing while read) fall back to a loop
+                while True:
+                    more = os.read(fd, 65536)
+                    if not more:
+                        break
+                    data += more
+            finally:
+                os.close(fd)
+            content = data.decode('utf-8', 'ignore')
+            if '\r' in content:
+                # Match text-mode universal newline translation
+                content = content.replace('\r\n', '\n').replace('\r', '\n')
+            result["content"] = content
         
         result["lines"] = len(result["content"].split('\n'))
         result["success"] = True
@@ -142,6 +208,7 @@ def read_file(file_path: str, max_lines: Optional[int] = None) -> Dict:
     return result
 
 
+@_with_cwd
 def write_file(file_path: str, content: str, create_dirs: bool = True) -> Dict:
     """
     Write content to a file.
@@ -166,7 +233,7 @@ def write_file(file_path: str, content: str, create_dirs: bool = True) -> Dict:
         
         # Security: ensure path is within current working directory
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
@@ -188,6 +255,7 @@ def write_file(file_path: str, content: str, create_dirs: bool = True) -> Dict:
     return result
 
 
+@_with_cwd
 def create_empty_file(file_path: str, create_dirs: bool = True) -> Dict:
     """
     Explicitly create an empty file before writing content.
@@ -210,7 +278,7 @@ def create_empty_file(file_path: str, create_dirs: bool = True) -> Dict:
         target_path = Path(file_path).resolve()
         # Security: ensure path is within current working directory
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
@@ -233,6 +301,7 @@ def create_empty_file(file_path: str, create_dirs: bool = True) -> Dict:
     return result
 
 
+@_with_cwd
 def delete_file(file_path: str) -> Dict:
     """
     Safely delete a file within the current working directory.
@@ -241,23 +310,27 @@ def delete_file(file_path: str) -> Dict:
     try:
         target_path = Path(file_path).resolve()
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
-        if not target_path.exists():
+        # One stat replaces the exists()/is_file() pair
+        try:
+            st = os.stat(target_path)
+        except FileNotFoundError:
             result["error"] = f"File not found: {file_path}"
             return result
-        if not target_path.is_file():
+        if not stat.S_ISREG(st.st_mode):
             result["error"] = f"Not a file: {file_path}"
             return result
-        target_path.unlink()
+        os.unlink(target_path)
         result["success"] = True
     except Exception as e:
         result["error"] = str(e)
     return result
 
 
+@_with_cwd
 def delete_folder(folder_path: str, recursive: bool = False) -> Dict:
     """
     Safely delete a folder. If recursive is True, delete contents.
@@ -266,26 +339,30 @@ def delete_folder(folder_path: str, recursive: bool = False) -> Dict:
     try:
         target_path = Path(folder_path).resolve()
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
-        if not target_path.exists():
+        # One stat replaces the exists()/is_dir() pair
+        try:
+            st = os.stat(target_path)
+        except FileNotFoundError:
             result["error"] = f"Folder not found: {folder_path}"
             return result
-        if not target_path.is_dir():
+        if not stat.S_ISDIR(st.st_mode):
             result["error"] = f"Not a folder: {folder_path}"
             return result
         if recursive:
             shutil.rmtree(target_path)
         else:
-            target_path.rmdir()
+            os.rmdir(target_path)
         result["success"] = True
     except Exception as e:
         result["error"] = str(e)
     return result
 
 
+@_with_cwd
 def create_folder(folder_path: str) -> Dict:
     """
     Create a new folder (and parent folders if needed).
@@ -308,7 +385,7 @@ def create_folder(folder_path: str) -> Dict:
         
         # Security: ensure path is within current working directory
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
@@ -328,6 +405,7 @@ def create_folder(folder_path: str) -> Dict:
     return result
 
 
+@_with_cwd
 def create_project_structure(project_name: str, structure: Dict[str, Any]) -> Dict:
     """
     Create a new project structure.
@@ -347,7 +425,7 @@ def create_project_structure(project_name: str, structure: Dict[str, Any]) -> Di
     }
     
     try:
-        project_path = Path.cwd() / project_name
+        project_path = _cwd() / project_name
         project_path.mkdir(parents=True, exist_ok=True)
         
         for folder_name, contents in structure.items():
@@ -367,6 +445,7 @@ def create_project_structure(project_name: str, structure: Dict[str, Any]) -> Di
     return result
 
 
+@_with_cwd
 def get_project_structure(path: str = ".", max_depth: int = 3) -> Dict:
     """
     Get a tree structure of the project.
@@ -386,27 +465,31 @@ def get_project_structure(path: str = ".", max_depth: int = 3) -> Dict:
         "error": None
     }
     
-    def build_tree(current_path: Path, depth: int) -> Dict:
+    def build_tree(current_path: str, depth: int) -> Dict:
         if depth > max_depth:
             return {"truncated": True}
         
         tree = {}
         try:
-            for item in sorted(current_path.iterdir()):
+            # scandir yields DirEntry objects whose type (and, on Windows,
+            # stat) information comes from the directory listing itself
+            with os.scandir(current_path) as it:
+                entries = sorted(it, key=lambda e: os.path.normcase(e.name))
+            for entry in entries:
                 # Skip hidden files/folders
-                if item.name.startswith('.'):
+                if entry.name.startswith('.'):
                     continue
                 
-                if item.is_file():
-                    tree[item.name] = {
+                if entry.is_file():
+                    tree[entry.name] = {
                         "type": "file",
-                        "size": item.stat().st_size
+                        "size": entry.stat().st_size
                     }
                     result["total_files"] += 1
-                elif item.is_dir():
-                    tree[item.name] = {
+                elif entry.is_dir():
+                    tree[entry.name] = {
                         "type": "folder",
-                        "contents": build_tree(item, depth + 1)
+                        "contents": build_tree(entry.path, depth + 1)
                     }
                     result["total_folders"] += 1
         except PermissionError:
@@ -419,12 +502,12 @@ def get_project_structure(path: str = ".", max_depth: int = 3) -> Dict:
         
         # Security: ensure path is within current working directory
         try:
-            target_path.relative_to(Path.cwd().resolve())
+            target_path.relative_to(_cwd())
         except ValueError:
             result["error"] = "Access denied: Path outside project directory"
             return result
         
-        result["structure"] = build_tree(target_path, 0)
+        result["structure"] = build_tree(str(target_path), 0)
         result["success"] = True
         
     except Exception as e:
@@ -433,6 +516,7 @@ def get_project_structure(path: str = ".", max_depth: int = 3) -> Dict:
     return result
 
 
+@_with_cwd
 def search_in_files(search_term: str, file_pattern: str = "*.py", max_results: int = 50) -> Dict:
     """
     Search for a term in files matching a pattern.
@@ -456,7 +540,7 @@ def search_in_files(search_term: str, file_pattern: str = "*.py", max_results: i
     }
     
     try:
-        cwd = Path.cwd()
+        cwd = _cwd()
         matches_found = 0
         
         for file_path in cwd.rglob(file_pattern):
@@ -492,6 +576,35 @@ def search_in_files(search_term: str, file_pattern: str = "*.py", max_results: i
     return result
 
 
+# Carousel page template; the CSS and JS assets are static and pre-encoded
+_CAROUSEL_INDEX = Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8" />
+    <title>$carousel_name Carousel</title>
+    <link rel="stylesheet" href="carousel.css" />
+</head>
+<body>
+    <div class="carousel-container">
+        <button class="nav prev" data-dir="-1">◀</button>
+        <div class="carousel-track">
+            $carousel_markup
+        </div>
+        <button class="nav next" data-dir="1">▶</button>
+    </div>
+    <script src="carousel.js"></script>
+</body>
+</html>
+""")
+
+_CAROUSEL_CSS = b"""body{font-family:Arial,Helvetica,sans-serif;background:#121212;color:#f5f5f5;display:flex;justify-content:center;align-items:center;height:100vh;margin:0}.carousel-container{display:flex;align-items:center;gap:1rem}.carousel-track{width:320px;height:200px;overflow:hidden;display:flex;scroll-behavior:smooth;border:2px solid #c8a882;border-radius:8px;background:rgba(0,0,0,0.35)}.carousel-item{min-width:320px;padding:1.5rem;display:flex;justify-content:center;align-items:center}.nav{background:#c8a882;border:none;color:#121212;font-size:1.25rem;padding:0.75rem 1rem;border-radius:4px;cursor:pointer}.nav:hover{background:#e6c9a6}.nav:active{transform:scale(0.95)}pre{margin:0;font-size:1rem;white-space:pre-wrap}
+"""
+
+_CAROUSEL_JS = b"""const track=document.querySelector('.carousel-track');const buttons=document.querySelectorAll('.nav');let index=0;const move=(dir)=>{const items=track.children;if(!items.length)return;index=(index+dir+items.length)%items.length;track.scrollTo({left:index*items[0].offsetWidth,behavior:'smooth'});};buttons.forEach(btn=>btn.addEventListener('click',()=>move(parseInt(btn.dataset.dir,10))));
+"""
+
+
+@_with_cwd
 def create_carousel_project(carousel_name: str, files: Dict[str, str], include_index: bool = True) -> Dict:
     """
     Create a folder representing a carousel with associated files and optional UI assets.
@@ -511,7 +624,7 @@ def create_carousel_project(carousel_name: str, files: Dict[str, str], include_i
 
         root_path = Path(carousel_name).resolve()
         try:
-            root_path.relative_to(Path.cwd().resolve())
+            root_path.relative_to(_cwd())
         except ValueError:
             result["errors"].append(f"Carousel path outside working directory: {carousel_name}")
             return result
@@ -543,49 +656,29 @@ def create_carousel_project(carousel_name: str, files: Dict[str, str], include_i
                 result["errors"].append(f"Failed to create {relative_path}: {str(e)}")
 
         if include_index:
-            file_cards = []
-            for relative_path in files.keys():
-                safe_name = os.path.basename(relative_path)
-                file_cards.append(f"<div class='carousel-item'><pre>{safe_name}</pre></div>")
-
-            carousel_markup = "\n".join(file_cards) if file_cards else "<div class='carousel-item'><pre>No files yet</pre></div>"
-
-            index_html = f"""<!DOCTYPE html>
-<html lang=\"en\">
-<head>
-    <meta charset=\"UTF-8\" />
-    <title>{carousel_name} Carousel</title>
-    <link rel=\"stylesheet\" href=\"carousel.css\" />
-</head>
-<body>
-    <div class=\"carousel-container\">
-        <button class=\"nav prev\" data-dir=\"-1\">◀</button>
-        <div class=\"carousel-track\">
-            {carousel_markup}
-        </div>
-        <button class=\"nav next\" data-dir=\"1\">▶</button>
-    </div>
-    <script src=\"carousel.js\"></script>
-</body>
-</html>
-"""
-
-            carousel_css = """body{font-family:Arial,Helvetica,sans-serif;background:#121212;color:#f5f5f5;display:flex;justify-content:center;align-items:center;height:100vh;margin:0}.carousel-container{display:flex;align-items:center;gap:1rem}.carousel-track{width:320px;height:200px;overflow:hidden;display:flex;scroll-behavior:smooth;border:2px solid #c8a882;border-radius:8px;background:rgba(0,0,0,0.35)}.carousel-item{min-width:320px;padding:1.5rem;display:flex;justify-content:center;align-items:center}.nav{background:#c8a882;border:none;color:#121212;font-size:1.25rem;padding:0.75rem 1rem;border-radius:4px;cursor:pointer}.nav:hover{background:#e6c9a6}.nav:active{transform:scale(0.95)}pre{margin:0;font-size:1rem;white-space:pre-wrap}
-"""
+            if files:
+                carousel_markup = "\n".join(
+                    f"<div class='carousel-item'><pre>{escape(os.path.basename(p))}</pre></div>"
+                    for p in files
+                )
+            else:
+                carousel_markup = "<div class='carousel-item'><pre>No files yet</pre></div>"
 
-            carousel_js = """const track=document.querySelector('.carousel-track');const buttons=document.querySelectorAll('.nav');let index=0;const move=(dir)=>{const items=track.children;if(!items.length)return;index=(index+dir+items.length)%items.length;track.scrollTo({left:index*items[0].offsetWidth,behavior:'smooth'});};buttons.forEach(btn=>btn.addEventListener('click',()=>move(parseInt(btn.dataset.dir,10))));
-"""
+            index_html = _CAROUSEL_INDEX.substitute(
+                carousel_name=escape(carousel_name),
+                carousel_markup=carousel_markup,
+            ).encode("utf-8")
 
             index_path = root_path / "index.html"
             css_path = root_path / "carousel.css"
             js_path = root_path / "carousel.js"
 
-            with open(index_path, "w", encoding="utf-8") as f:
+            with open(index_path, "wb") as f:
                 f.write(index_html)
-            with open(css_path, "w", encoding="utf-8") as f:
-                f.write(carousel_css)
-            with open(js_path, "w", encoding="utf-8") as f:
-                f.write(carousel_js)
+            with open(css_path, "wb") as f:
+                f.write(_CAROUSEL_CSS)
+            with open(js_path, "wb") as f:
+                f.write(_CAROUSEL_JS)
 
             result["created_files"].extend([
                 str(index_path),
@@ -600,6 +693,7 @@ def create_carousel_project(carousel_name: str, files: Dict[str, str], include_i
     return result
 
 
+@_with_cwd
 def execute_safe_command(command_name: str, **kwargs) -> Dict:
     """
     Execute a safe, predefined command.
@@ -648,31 +742,103 @@ if __name__ == "__main__":
     # Example 1: List current directory
     print("1. Listing current directory:")
     result = list_directory(".")
-    print(json.dumps(result, indent=2))
+    print(_dump(result))
     
     # Example 2: Get project structure
     print("\n2. Getting project structure:")
     result = get_project_structure(".", max_depth=2)
-    print(json.dumps(result, indent=2))
+    print(_dump(result))
     
     # Example 3: Execute safe command
     print("\n3. Executing safe command:")
     result = execute_safe_command("list_directory", path=".")
-    print(json.dumps(result, indent=2))
+    print(_dump(result))
+
+# Pipe read size for run_command_async; large reads amortize per-chunk overhead
+_STREAM_READ_SIZE = 65536
+# Captured output kept per stream: the first and last bytes, middle dropped
+_OUTPUT_HEAD_BYTES = 64 * 1024
+_OUTPUT_TAIL_BYTES = 256 * 1024
+
+
+class _BoundedOutput:
+    """Byte sink keeping the head and tail of a stream, dropping the middle."""
+
+    __slots__ = ("head", "tail", "head_size", "tail_size", "dropped")
+
+    def __init__(self, head_size: int = _OUTPUT_HEAD_BYTES, tail_size: int = _OUTPUT_TAIL_BYTES):
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.dropped = 0
+
+    def write(self, data: bytes) -> None:
+        room = self.head_size - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail += data
+        # Trim lazily (at 2x the budget) so the cost of del is amortized
+        if len(self.tail) > 2 * self.tail_size:
+            self._trim()
+
+    def _trim(self) -> None:
+        excess = len(self.tail) - self.tail_size
+        if excess > 0:
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def getvalue(self) -> str:
+        self._trim()
+        if not self.dropped:
+            return (self.head + self.tail).decode('utf-8', 'ignore')
+        return (
+            self.head.decode('utf-8', 'ignore')
+            + f"\n... [truncated {self.dropped} bytes] ...\n"
+            + self.tail.decode('utf-8', 'ignore')
+        )
+
 
+_ALLOWED_PREFIXES = (
+    "npm", "pnpm", "yarn", "npx", "pytest", "pip", "python",
+    "node", "serve", "http-server"
+)
+# Leading whitespace, then any allowed prefix (prefix match, e.g. python3, pip3)
+_ALLOWED_RE = re.compile(
+    r"\s*(?:" + "|".join(re.escape(p) for p in _ALLOWED_PREFIXES) + ")",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=256)
 def _is_command_allowed(cmd: str) -> bool:
     """Basic allowlist to prevent destructive shell commands."""
-    cmd = cmd.strip().lower()
-    if not cmd:
-        return False
-    allowed_prefixes = [
-        "npm", "pnpm", "yarn", "npx", "pytest", "pip", "python",
-        "node", "serve", "http-server"
-    ]
-    first = cmd.split()[0]
-    return any(first == p or first.startswith(p) for p in allowed_prefixes)
-
-async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Optional[int] = None, env: Optional[Dict[str, str]] = None) -> Dict:
+    return _ALLOWED_RE.match(cmd) is not None
+
+
+def _classify_error(stderr: str, exit_code: Optional[int]) -> str:
+    # Plain substring checks on one lowercased copy, in priority order; each
+    # "in" is a C-level scan, far cheaper than a multi-branch regex pass
+    s = (stderr or "").lower()
+    if "permission denied" in s or "access is denied" in s:
+        return "permission"
+    if "address already in use" in s or "port" in s and "in use" in s:
+        return "port_in_use"
+    if "module not found" in s or "cannot import" in s or "no module named" in s:
+        return "missing_dependency"
+    if "assert" in s or "failed" in s and "test" in s:
+        return "test_failure"
+    if "syntaxerror" in s or "traceback" in s and exit_code:
+        return "runtime_error"
+    if exit_code:
+        return "error"
+    return "unknown"
+
+async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Optional[int] = None, env: Optional[Dict[str, str]] = None,
+                            max_head_bytes: int = _OUTPUT_HEAD_BYTES, max_tail_bytes: int = _OUTPUT_TAIL_BYTES) -> Dict:
     """
     Run a shell command safely and allow interruption via asyncio cancellation.
 
@@ -681,14 +847,18 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
         cwd: Working directory (must be within current project path).
         timeout: Optional timeout in seconds.
         env: Optional environment overrides.
+        max_head_bytes: Bytes kept from the start of stdout/stderr.
+        max_tail_bytes: Bytes kept from the end of stdout/stderr. Anything
+            in between is dropped from the result (the log keeps it all).
 
     Returns:
         Dictionary with execution result and logs.
     """
+    cwd_root = _cwd()
     result = {
         "success": False,
         "command": command,
-        "cwd": cwd or str(Path.cwd()),
+        "cwd": cwd or str(cwd_root),
         "exit_code": None,
         "stdout": "",
         "stderr": "",
@@ -699,22 +869,7 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
         "log_path": None,
         "error_class": None,
     }
-
-    def _classify_error(stderr: str, exit_code: Optional[int]) -> str:
-        s = (stderr or "").lower()
-        if "permission denied" in s or "access is denied" in s:
-            return "permission"
-        if "address already in use" in s or "port" in s and "in use" in s:
-            return "port_in_use"
-        if "module not found" in s or "cannot import" in s or "no module named" in s:
-            return "missing_dependency"
-        if "assert" in s or "failed" in s and "test" in s:
-            return "test_failure"
-        if "syntaxerror" in s or "traceback" in s and exit_code:
-            return "runtime_error"
-        if exit_code:
-            return "error"
-        return "unknown"
+    log_fd: Optional[int] = None
 
     try:
         if not _is_command_allowed(command):
@@ -722,9 +877,9 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
             return result
 
         # Resolve and validate cwd within project
-        workdir = Path(cwd).resolve() if cwd else Path.cwd().resolve()
+        workdir = Path(cwd).resolve() if cwd else cwd_root
         try:
-            workdir.relative_to(Path.cwd().resolve())
+            workdir.relative_to(cwd_root)
         except ValueError:
             result["error"] = "Access denied: cwd outside project directory"
             return result
@@ -748,6 +903,23 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
                 if isinstance(k, str) and isinstance(v, str):
                     run_env[k] = v
 
+        # Open the log once; output is streamed into it as it arrives so
+        # partial logs survive a crash of the CLI itself
+        try:
+            log_fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY, 0o644)
+        except OSError:
+            log_fd = None
+
+        def _log(data: bytes) -> None:
+            if log_fd is None:
+                return
+            try:
+                os.write(log_fd, data)
+            except OSError:
+                pass
+
+        _log(f"$ {command}\nstarted_at={result['started_at']}\n\n".encode("utf-8"))
+
         # Start subprocess (shell for convenience)
         proc = await asyncio.create_subprocess_shell(
             command,
@@ -757,51 +929,34 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
             env=run_env
         )
 
+        # Raw bytes are kept bounded while reading and decoded once at the end
+        stdout_buf = _BoundedOutput(max_head_bytes, max_tail_bytes)
+        stderr_buf = _BoundedOutput(max_head_bytes, max_tail_bytes)
+
         async def _read_stream(stream, buf):
             try:
                 while True:
-                    chunk = await stream.read(1024)
+                    chunk = await stream.read(_STREAM_READ_SIZE)
                     if not chunk:
                         break
-                    buf.append(chunk.decode(errors='ignore'))
+                    buf.write(chunk)
+                    _log(chunk)
             except Exception:
                 # Swallow stream read errors
                 pass
 
-        stdout_buf = []
-        stderr_buf = []
-        read_out = asyncio.create_task(_read_stream(proc.stdout, stdout_buf))
-        read_err = asyncio.create_task(_read_stream(proc.stderr, stderr_buf))
+        # Reader tasks rather than communicate(): output read before a
+        # timeout or cancellation is kept, and memory stays bounded
+        readers = [
+            asyncio.create_task(_read_stream(proc.stdout, stdout_buf)),
+            asyncio.create_task(_read_stream(proc.stderr, stderr_buf)),
+        ]
 
-        try:
-            if timeout:
-                await asyncio.wait_for(proc.wait(), timeout=timeout)
-            else:
-                await proc.wait()
-            await asyncio.gather(read_out, read_err)
-            result["exit_code"] = proc.returncode
-            result["stdout"] = ''.join(stdout_buf)
-            result["stderr"] = ''.join(stderr_buf)
-            result["error_class"] = _classify_error(result["stderr"], result["exit_code"])
-            result["success"] = proc.returncode == 0
-            # Write log file
-            try:
-                with open(log_file, "w", encoding="utf-8", errors="ignore") as f:
-                    f.write(f"$ {command}\n")
-                    f.write(f"started_at={result['started_at']} ended_at={datetime.now().isoformat()} exit_code={proc.returncode}\n\n")
-                    if result["stdout"]:
-                        f.write("--- stdout ---\n")
-                        f.write(result["stdout"]) 
-                        f.write("\n")
-                    if result["stderr"]:
-                        f.write("--- stderr ---\n")
-                        f.write(result["stderr"]) 
-                        f.write("\n")
-            except Exception:
-                pass
-            return result
-        except asyncio.TimeoutError:
-            # Timeout -> terminate
+        async def _drain():
+            await proc.wait()
+            await asyncio.gather(*readers)
+
+        async def _terminate():
             try:
                 proc.terminate()
             except ProcessLookupError:
@@ -813,64 +968,36 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
                     proc.kill()
                 except Exception:
                     pass
-            await asyncio.gather(read_out, read_err, return_exceptions=True)
+            await asyncio.gather(*readers, return_exceptions=True)
+
+        def _collect(marker: str = "") -> None:
             result["exit_code"] = proc.returncode
-            result["stdout"] = ''.join(stdout_buf)
-            result["stderr"] = ''.join(stderr_buf)
-            result["error"] = "Command timed out"
+            result["stdout"] = stdout_buf.getvalue()
+            result["stderr"] = stderr_buf.getvalue()
             result["error_class"] = _classify_error(result["stderr"], result["exit_code"])
+            _log(f"\nended_at={datetime.now().isoformat()}{marker} exit_code={proc.returncode}\n".encode("utf-8"))
+
+        try:
+            if timeout:
+                await asyncio.wait_for(_drain(), timeout=timeout)
+            else:
+                await _drain()
+            _collect()
+            result["success"] = proc.returncode == 0
+            return result
+        except asyncio.TimeoutError:
+            # Timeout -> terminate
+            await _terminate()
+            _collect(" timeout=1")
+            result["error"] = "Command timed out"
             result["success"] = False
-            # Write log file
-            try:
-                with open(log_file, "w", encoding="utf-8", errors="ignore") as f:
-                    f.write(f"$ {command}\n")
-                    f.write(f"started_at={result['started_at']} ended_at={datetime.now().isoformat()} timeout=1 exit_code={proc.returncode}\n\n")
-                    if result["stdout"]:
-                        f.write("--- stdout ---\n")
-                        f.write(result["stdout"]) 
-                        f.write("\n")
-                    if result["stderr"]:
-                        f.write("--- stderr ---\n")
-                        f.write(result["stderr"]) 
-                        f.write("\n")
-            except Exception:
-                pass
             return result
         except asyncio.CancelledError:
             # Cancellation -> terminate quickly and propagate
-            try:
-                proc.terminate()
-            except ProcessLookupError:
-                pass
-            try:
-                await asyncio.wait_for(proc.wait(), timeout=2)
-            except Exception:
-                try:
-                    proc.kill()
-                except Exception:
-                    pass
-            await asyncio.gather(read_out, read_err, return_exceptions=True)
-            result["exit_code"] = proc.returncode
-            result["stdout"] = ''.join(stdout_buf)
-            result["stderr"] = ''.join(stderr_buf)
+            await _terminate()
+            _collect(" cancelled=1")
             result["cancelled"] = True
-            result["error_class"] = _classify_error(result["stderr"], result["exit_code"])
             result["success"] = False
-            # Write log file
-            try:
-                with open(log_file, "w", encoding="utf-8", errors="ignore") as f:
-                    f.write(f"$ {command}\n")
-                    f.write(f"started_at={result['started_at']} ended_at={datetime.now().isoformat()} cancelled=1 exit_code={proc.returncode}\n\n")
-                    if result["stdout"]:
-                        f.write("--- stdout ---\n")
-                        f.write(result["stdout"]) 
-                        f.write("\n")
-                    if result["stderr"]:
-                        f.write("--- stderr ---\n")
-                        f.write(result["stderr"]) 
-                        f.write("\n")
-            except Exception:
-                pass
             raise
         finally:
             result["ended_at"] = datetime.now().isoformat()
@@ -887,8 +1014,14 @@ async def run_command_async(command: str, cwd: Optional[str] = None, timeout: Op
         except Exception:
             pass
         return result
+    finally:
+        if log_fd is not None:
+            try:
+                os.close(log_fd)
+            except OSError:
+                pass
 
-aSYNC_COMMANDS = {
+aSYNC_COMMANDS = MappingProxyType({
     "run_command": run_command_async,
     "run_command_bg": start_process,
     "stop_process": stop_process,
@@ -897,18 +1030,20 @@ aSYNC_COMMANDS = {
     "tail_logs": tail_logs,
     "launch_auto": launch_auto,
     "stop_all_processes": stop_all_processes,
-}
+})
+_AVAILABLE_ASYNC = tuple(aSYNC_COMMANDS)
 
 async def execute_safe_command_async(command_name: str, **kwargs) -> Dict:
     """Async dispatcher for commands that need cancellation support."""
-    if command_name not in aSYNC_COMMANDS:
+    handler = aSYNC_COMMANDS.get(command_name)
+    if handler is None:
         return {
             "success": False,
             "error": f"Unknown async command: {command_name}",
-            "available_async": list(aSYNC_COMMANDS.keys())
+            "available_async": _AVAILABLE_ASYNC
         }
     try:
-        return await aSYNC_COMMANDS[command_name](**kwargs)
+        return await handler(**kwargs)
     except asyncio.CancelledError:
         # Propagate cancellation
         raise
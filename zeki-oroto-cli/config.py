@@ -4,8 +4,20 @@ Reads configuration from environment variables or .env file
 """
 
 import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict
+from types import MappingProxyType
+from typing import Mapping
+
+# (config key, environment variable, default, type)
+_CONFIG_SPEC = (
+    ("api_key", "AI_API_KEY", None, str),
+    ("model", "MODEL", "x-ai/grok-4-fast:free", str),
+    ("api_endpoint", "API_ENDPOINT", "https://openrouter.ai/api/v1/chat/completions", str),
+    ("max_context_length", "MAX_CONTEXT_LENGTH", 8000, int),
+    ("temperature", "TEMPERATURE", 0.7, float),
+    ("log_level", "LOG_LEVEL", "info", str),
+)
 
 
 def load_env_file(env_path: str = ".env") -> None:
@@ -59,7 +71,8 @@ def load_env_file(env_path: str = ".env") -> None:
             pass
 
 
-def get_config() -> Dict:
+@lru_cache(maxsize=1)
+def get_config() -> Mapping:
     """
     Get configuration from environment variables or .env file.
     
@@ -68,24 +81,25 @@ def get_config() -> Dict:
     2. .env file
     3. Default values
     
+    The result is computed once per process; call get_config.cache_clear()
+    to pick up environment changes (e.g. in tests).
+    
     Returns:
-        Dictionary with configuration settings
+        Read-only mapping with configuration settings
     """
     # Try to load .env file first
     load_env_file()
     
+    env = os.environ
     config = {
-        "api_key": os.environ.get("AI_API_KEY"),
-        "model": os.environ.get("MODEL", "x-ai/grok-4-fast:free"),
-        "api_endpoint": os.environ.get("API_ENDPOINT", "https://openrouter.ai/api/v1/chat/completions"),
-        "max_context_length": int(os.environ.get("MAX_CONTEXT_LENGTH", "8000")),
-        "temperature": float(os.environ.get("TEMPERATURE", "0.7"))
+        key: cast(value) if (value := env.get(env_key)) is not None else default
+        for key, env_key, default, cast in _CONFIG_SPEC
     }
     
-    return config
+    return MappingProxyType(config)
 
 
-def validate_config(config: Dict) -> bool:
+def validate_config(config: Mapping) -> bool:
     """
     Validate that required configuration is present.
     
@@ -3,105 +3,283 @@ Simple local key store with lightweight encryption for user-supplied API keys.
 - Stores the user's OpenRouter API key encrypted in key_store.db (JSON)
 - Persists a use_user_key flag so remote requests use the user's key
 
-Note: This uses a basic XOR + base64 obfuscation with a machine-bound derived key.
-It is NOT crypto-grade security, but avoids storing plaintext. For stronger
-security, integrate OS keychain or a proper cryptography library.
+Note: When the optional `cryptography` package is installed, keys are encrypted
+with Fernet (AES-128-CBC + HMAC-SHA256) using a machine-bound derived key.
+Without it, a basic XOR + base64 obfuscation is used instead; that is NOT
+crypto-grade security, but avoids storing plaintext. Tokens written by the XOR
+scheme are still readable and are re-encrypted with Fernet on next access.
 """
 
 import os
 import json
+import atexit
+import threading
 import base64
 import getpass
 import platform
 import secrets
+import tempfile
+import time
 import hashlib
 from pathlib import Path
-from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # optional dependency
+    Fernet = None
+    InvalidToken = None
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
 
 BASE_DIR = Path(__file__).resolve().parent
 STORE_PATH = BASE_DIR / "key_store.db"
 SALT_PATH = BASE_DIR / ".keystore_salt"
+# Seconds to wait for further changes before writing the store to disk
+_WRITE_DELAY = 0.5
+
+# Process-invariant inputs to the machine-bound key
+_MACHINE = platform.node()
+try:
+    _USER = getpass.getuser()
+except Exception:
+    _USER = ""
+
+
+def _replace_file(path: Path, payload: bytes) -> None:
+    # One write(2) into an owner-only temp file, then an atomic rename. mkstemp
+    # gives every writer its own temp name, so concurrent CLIs never share one
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _utc_timestamp() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+
+
+def _dumps(data: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def _loads(raw: bytes) -> Dict:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
 class KeyStore:
     def __init__(self, store_path: Optional[Path] = None):
         self.store_path = Path(store_path) if store_path else STORE_PATH
         self.salt_path = SALT_PATH
-        self._ensure_salt()
+        self._salt_bytes: Optional[bytes] = None
+        self._cached_key: Optional[bytes] = None
+        self._fernet = None
+        # (key, repeated key) reused by _xor across calls
+        self._keystream: Optional[Tuple[bytes, bytes]] = None
+        # Last decrypted API key and the token it came from
+        self._plaintext_token: Optional[str] = None
+        self._plaintext_cache: Optional[str] = None
+        # Pending store contents not yet on disk (coalesced writes)
+        self._pending: Optional[Dict] = None
+        self._flush_timer: Optional[threading.Timer] = None
+        self._write_lock = threading.Lock()
+        # Last parsed store contents, valid while (mtime_ns, size) is unchanged;
+        # the size catches same-tick rewrites on coarse-timestamp filesystems
+        self._store_cache: Optional[Dict] = None
+        self._store_sig: Optional[Tuple[int, int]] = None
 
     def _ensure_salt(self) -> None:
-        if not self.salt_path.exists():
+        try:
+            self._salt_bytes = self.salt_path.read_bytes()
+            return
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return
+        salt = secrets.token_bytes(32)
+        try:
+            _replace_file(self.salt_path, salt)
+            self._salt_bytes = salt
+        except Exception:
+            # Fallback: create parent dir then write
             try:
-                self.salt_path.write_bytes(secrets.token_bytes(32))
+                self.salt_path.parent.mkdir(parents=True, exist_ok=True)
+                _replace_file(self.salt_path, salt)
+                self._salt_bytes = salt
             except Exception:
-                # Fallback: create parent dir then write
-                try:
-                    self.salt_path.parent.mkdir(parents=True, exist_ok=True)
-                    self.salt_path.write_bytes(secrets.token_bytes(32))
-                except Exception:
-                    pass
+                pass
 
     def _derive_key(self) -> bytes:
-        try:
-            salt = self.salt_path.read_bytes()
-        except Exception:
-            salt = b"oroto-default-salt"
-        machine = platform.node()
-        user = getpass.getuser()
-        basis = f"{machine}:{user}".encode("utf-8")
-        return hashlib.sha256(basis + salt).digest()
+        # The derived key never changes within a process; compute it once
+        if self._cached_key is not None:
+            return self._cached_key
+        salt = self._salt_bytes
+        if salt is None:
+            # Salt is read (or created) lazily on first cryptographic use
+            self._ensure_salt()
+            salt = self._salt_bytes or b"oroto-default-salt"
+        # Feed basis and salt separately rather than hashing a concatenated copy
+        h = hashlib.sha256(f"{_MACHINE}:{_USER}".encode("utf-8"))
+        h.update(salt)
+        self._cached_key = h.digest()
+        return self._cached_key
+
+    def invalidate_key_cache(self) -> None:
+        """Drop the cached salt and derived key (e.g. after salt rotation)."""
+        self._salt_bytes = None
+        self._cached_key = None
+        self._fernet = None
+        self._keystream = None
+        self._plaintext_token = None
+        self._plaintext_cache = None
+
+    def _get_fernet(self):
+        if self._fernet is None and Fernet is not None:
+            self._fernet = Fernet(base64.urlsafe_b64encode(self._derive_key()[:32]))
+        return self._fernet
 
     def _xor(self, data: bytes, key: bytes) -> bytes:
-        out = bytearray(len(data))
-        klen = len(key)
-        for i, b in enumerate(data):
-            out[i] = b ^ key[i % klen]
-        return bytes(out)
+        if not data:
+            return b""
+        n = len(data)
+        cached = self._keystream
+        if cached is None or cached[0] != key or len(cached[1]) < n:
+            # Repeat the key out to at least 1 KB so typical payloads reuse it
+            stream = key * (max(n, 1024) // len(key) + 1)
+            self._keystream = cached = (key, stream)
+        ks = cached[1][:n]
+        # Single big-int XOR instead of a per-byte Python loop
+        return (int.from_bytes(data, "big") ^ int.from_bytes(ks, "big")).to_bytes(n, "big")
 
     def encrypt(self, plain_text: str) -> str:
+        fernet = self._get_fernet()
+        if fernet is not None:
+            return fernet.encrypt(plain_text.encode("utf-8")).decode("ascii")
         key = self._derive_key()
         raw = plain_text.encode("utf-8")
         x = self._xor(raw, key)
         return base64.b64encode(x).decode("ascii")
 
-    def decrypt(self, token: str) -> str:
+    def _decrypt_token(self, token: str) -> Tuple[str, bool]:
+        """Decrypt a token; the flag is True when it used the legacy XOR format."""
+        fernet = self._get_fernet()
+        if fernet is not None:
+            try:
+                return fernet.decrypt(token.encode("ascii")).decode("utf-8"), False
+            except InvalidToken:
+                pass
         key = self._derive_key()
         raw = base64.b64decode(token.encode("ascii"))
         x = self._xor(raw, key)
-        return x.decode("utf-8")
+        return x.decode("utf-8"), fernet is not None
+
+    def decrypt(self, token: str) -> str:
+        return self._decrypt_token(token)[0]
 
     def _read_store(self) -> Dict:
-        if self.store_path.exists():
-            try:
-                with open(self.store_path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
+        pending = self._pending
+        if pending is not None:
+            return dict(pending)
+        try:
+            st = self.store_path.stat()
+        except OSError:
+            return {}
+        sig = (st.st_mtime_ns, st.st_size)
+        if self._store_cache is not None and sig == self._store_sig:
+            return dict(self._store_cache)
+        try:
+            data = _loads(self.store_path.read_bytes())
+        except (OSError, ValueError):
+            return {}
+        self._store_cache = data
+        self._store_sig = sig
+        return dict(data)
+
+    def _remember_store(self, data: Dict) -> None:
+        try:
+            st = self.store_path.stat()
+            self._store_sig = (st.st_mtime_ns, st.st_size)
+            self._store_cache = dict(data)
+        except OSError:
+            self._store_cache = None
 
     def _write_store(self, data: Dict) -> None:
         try:
-            with open(self.store_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
+            payload = _dumps(data)
+        except Exception:
+            return
+        try:
+            _replace_file(self.store_path, payload)
+            self._remember_store(data)
         except Exception:
             # Attempt directory creation then retry
             try:
                 self.store_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(self.store_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, indent=2)
+                _replace_file(self.store_path, payload)
+                self._remember_store(data)
             except Exception:
                 pass
 
+    def _schedule_write(self, data: Dict) -> None:
+        """Keep data in memory and write it once no change arrives for _WRITE_DELAY."""
+        with self._write_lock:
+            self._pending = dict(data)
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            timer = threading.Timer(_WRITE_DELAY, self.flush)
+            timer.daemon = True
+            self._flush_timer = timer
+            timer.start()
+
+    def _write_now(self, data: Dict) -> None:
+        """Write data immediately, superseding any pending delayed write."""
+        with self._write_lock:
+            self._pending = dict(data)
+        self.flush()
+
+    def flush(self) -> None:
+        """Write any pending store changes to disk now."""
+        with self._write_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._pending is None:
+                return
+            self._write_store(self._pending)
+            self._pending = None
+
+    def close(self) -> None:
+        self.flush()
+
     def set_user_key(self, api_key: str, provider: str = "openrouter") -> None:
         if not api_key:
             raise ValueError("API key boş olamaz")
         data = self._read_store()
         data["provider"] = provider
-        data["encrypted_api_key"] = self.encrypt(api_key)
+        data["encrypted_api_key"] = self._plaintext_token = self.encrypt(api_key)
+        self._plaintext_cache = api_key
         data["use_user_key"] = True
-        data["updated_at"] = datetime.utcnow().isoformat()
-        self._write_store(data)
+        data["updated_at"] = _utc_timestamp()
+        # Credential changes go to disk right away so a crash cannot lose them
+        self._write_now(data)
 
     def has_user_key(self) -> bool:
         data = self._read_store()
@@ -112,10 +290,19 @@ class KeyStore:
         token = data.get("encrypted_api_key")
         if not token:
             return None
+        if token == self._plaintext_token and self._plaintext_cache is not None:
+            return self._plaintext_cache
         try:
-            return self.decrypt(token)
+            plain, legacy = self._decrypt_token(token)
         except Exception:
             return None
+        if legacy:
+            # One-time migration of an XOR token to Fernet
+            token = data["encrypted_api_key"] = self.encrypt(plain)
+            self._schedule_write(data)
+        self._plaintext_token = token
+        self._plaintext_cache = plain
+        return plain
 
     def use_user_key(self) -> bool:
         data = self._read_store()
@@ -124,5 +311,29 @@ class KeyStore:
     def set_use_user_key(self, value: bool) -> None:
         data = self._read_store()
         data["use_user_key"] = bool(value)
-        data["updated_at"] = datetime.utcnow().isoformat()
-        self._write_store(data)
\ No newline at end of file
+        data["updated_at"] = _utc_timestamp()
+        self._write_now(data)
+
+
+_SINGLETON: Optional[KeyStore] = None
+
+
+def get_key_store() -> KeyStore:
+    """Return the shared process-wide KeyStore.
+
+    Application code should use this so the salt, derived-key and store caches
+    are shared; construct KeyStore() directly only in tests.
+    """
+    global _SINGLETON
+    if _SINGLETON is None:
+        _SINGLETON = KeyStore()
+    return _SINGLETON
+
+
+def _flush_on_exit() -> None:
+    # Delayed writes (e.g. a token migration) still pending at shutdown
+    if _SINGLETON is not None:
+        _SINGLETON.flush()
+
+
+atexit.register(_flush_on_exit)
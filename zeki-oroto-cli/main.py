@@ -7,34 +7,81 @@ A CLI tool designed for step-by-step task execution with built-in task breakdown
 import os
 import sys
 import json
+import time
 import re
-import httpx
+import string
 import asyncio
-import difflib
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
+from itertools import count, islice
 from pathlib import Path
-from rich.console import Console
+import httpx
+from rich.console import Console, Group
 from rich.panel import Panel
-from rich.markdown import Markdown
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.prompt import Confirm, Prompt
 from rich.table import Table
-from typing import List, Dict, Optional
+from rich.text import Text
+from typing import Any, List, Dict, Optional
+
+# Only difflib and rich.markdown (which pulls in markdown-it and pygments) are
+# imported where they are used, since they dominate startup time
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
 
 # Import configuration and commands
 from config import get_config, validate_config
 from commands import execute_safe_command, execute_safe_command_async
-from key_store import KeyStore
+# The REPL's own process commands call these directly; AI directives go
+# through execute_safe_command_async
+from process_manager import (
+    launch_auto,
+    list_processes,
+    restart_process,
+    start_process,
+    stop_all_processes,
+    stop_process,
+    tail_logs,
+)
+from key_store import KeyStore, get_key_store
+from thinking_python import (
+    break_down_task,
+    classify_defects,
+    create_version_snapshot,
+    estimate_task_complexity,
+    prevent_hallucination_in_long_tasks,
+    sanitize_input,
+)
+
+# Pure on its input and called for every step description
+_estimate_complexity = lru_cache(maxsize=256)(estimate_task_complexity)
 
 # Console setup
 console = Console()
 
+
+def _print_status(message: str, style: str) -> None:
+    """Print a one-line status message in a single style.
+
+    The message is wrapped in a Text, so it skips the markup parser and
+    interpolated values containing "[" are printed as-is.
+    """
+    console.print(Text(message, style=style))
+
 # Load configuration
 CONFIG = get_config()
 
 # Extract configuration (do not hard-exit if API key is missing)
 API_KEY = CONFIG.get("api_key")
 API_ENDPOINT = CONFIG.get("api_endpoint")
+LOG_LEVEL = (CONFIG.get("log_level") or "info").lower()
 BASE_DIR = Path(__file__).resolve().parent
 
 # Uzaktaki modeller icin OpenRouter anahtari bilgisi
@@ -44,66 +91,179 @@ if not API_KEY:
 # Model will be selected by user
 MODEL = None
 
+# Seconds to reuse the Ollama model list before querying the daemon again
+_OLLAMA_MODELS_TTL = 30.0
+_ollama_models_cache: Optional[tuple] = None
+_OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
+# Keep-alive client reused by the synchronous model-list probe
+_ollama_sync_client = None
+
+
+def _json_loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _json_default(obj):
+    # Bounded executor memory is kept in deques; store them as plain lists
+    if isinstance(obj, deque):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, default=_json_default).encode('utf-8')
+
+
+def _json_body(obj) -> bytes:
+    """Compact JSON for request bodies"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+
+def _write_bytes_atomic(path: Path, payload: bytes) -> None:
+    # pid plus a random suffix, so two CLI processes never write the same temp file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{os.urandom(4).hex()}.tmp")
+    try:
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def _write_json_atomic(path: Path, obj) -> None:
+    """Write JSON to a temp file and rename it over path, so readers never see a torn file"""
+    _write_bytes_atomic(path, _json_dumps(obj))
+
+
+def _read_json(path) -> Any:
+    """Parse a JSON file in one read (a fresh object each call, so callers may mutate it)"""
+    with open(path, 'rb') as f:
+        return _json_loads(f.read())
+
+
+def _ollama_probe_timeout():
+    # Fail fast when the daemon is not listening
+    return httpx.Timeout(2.0, connect=0.5)
+
+
+def _parse_ollama_tags(data: Dict) -> List[Dict]:
+    ollama_models = []
+    for model in data.get("models", []):
+        # Format size nicely
+        size = model.get('size', 0)
+        if size > 1024**3:  # GB
+            size_str = f"{size / (1024**3):.1f}GB"
+        elif size > 1024**2:  # MB
+            size_str = f"{size / (1024**2):.0f}MB"
+        else:
+            size_str = "Unknown"
+        
+        ollama_models.append({
+            "id": f"ollama/{model['name']}",
+            "name": f"{model['name']} (Local)",
+            "description": f"Local Ollama model - Size: {size_str}",
+            "type": "local"
+        })
+    return ollama_models
+
+
+def _cached_ollama_models() -> Optional[List[Dict]]:
+    cached = _ollama_models_cache
+    if cached is not None and time.monotonic() - cached[0] < _OLLAMA_MODELS_TTL:
+        return [dict(m) for m in cached[1]]
+    return None
+
+
+def _store_ollama_models(models: List[Dict]) -> List[Dict]:
+    global _ollama_models_cache
+    _ollama_models_cache = (time.monotonic(), models)
+    return [dict(m) for m in models]
+
 
 def get_ollama_models() -> List[Dict]:
-    """Get locally installed Ollama models"""
+    """Get locally installed Ollama models (cached for a short TTL)"""
+    cached = _cached_ollama_models()
+    if cached is not None:
+        return cached
+    return _store_ollama_models(_fetch_ollama_models())
+
+
+async def get_ollama_models_async() -> List[Dict]:
+    """Async variant of get_ollama_models using the shared AIClient connection pool"""
+    cached = _cached_ollama_models()
+    if cached is not None:
+        return cached
+    models = []
     try:
-        import httpx
-        with httpx.Client(timeout=5.0) as client:
-            response = client.get("http://localhost:11434/api/tags")
-            if response.status_code == 200:
-                data = response.json()
-                ollama_models = []
-                for model in data.get("models", []):
-                    # Format size nicely
-                    size = model.get('size', 0)
-                    if size > 1024**3:  # GB
-                        size_str = f"{size / (1024**3):.1f}GB"
-                    elif size > 1024**2:  # MB
-                        size_str = f"{size / (1024**2):.0f}MB"
-                    else:
-                        size_str = "Unknown"
-                    
-                    ollama_models.append({
-                        "id": f"ollama/{model['name']}",
-                        "name": f"{model['name']} (Local)",
-                        "description": f"Local Ollama model - Size: {size_str}",
-                        "type": "local"
-                    })
-                return ollama_models
-    except Exception as e:
+        client = AIClient._get_client("ollama")
+        response = await client.get(_OLLAMA_TAGS_URL, timeout=_ollama_probe_timeout())
+        if response.status_code == 200:
+            models = _parse_ollama_tags(response.json())
+    except Exception:
+        # Ollama not running or not available - this is normal
+        pass
+    return _store_ollama_models(models)
+
+
+def _fetch_ollama_models() -> List[Dict]:
+    """Query the local Ollama daemon for installed models"""
+    global _ollama_sync_client
+    try:
+        if _ollama_sync_client is None:
+            _ollama_sync_client = httpx.Client(timeout=_ollama_probe_timeout())
+        response = _ollama_sync_client.get(_OLLAMA_TAGS_URL)
+        if response.status_code == 200:
+            return _parse_ollama_tags(response.json())
+    except Exception:
         # Ollama not running or not available - this is normal
         pass
     return []
 
 
-def load_models() -> List[Dict]:
-    """Load available models from models.json and Ollama"""
-    all_models = []
+@dataclass
+class ModelCatalog:
+    """Available models split by source; `all` lists local models first"""
+    local: List[Dict] = field(default_factory=list)
+    remote: List[Dict] = field(default_factory=list)
+    all: List[Dict] = field(init=False)
+    
+    def __post_init__(self):
+        self.all = self.local + self.remote
+
+
+def load_models(ollama_models: Optional[List[Dict]] = None) -> ModelCatalog:
+    """Load available models from models.json and Ollama
     
+    ollama_models may be passed in when already fetched (e.g. asynchronously).
+    """
     # Load local Ollama models first for better UX (no API key required)
-    ollama_models = get_ollama_models()
-    all_models.extend(ollama_models)
+    if ollama_models is None:
+        ollama_models = get_ollama_models()
     
-    # Then load remote models from JSON
+    # Then load remote models from JSON, tagged as they are read
+    remote_models = []
     try:
         models_file = BASE_DIR / "models.json"
         if models_file.exists():
-            with open(models_file, 'r') as f:
-                data = json.load(f)
-                remote_models = data.get("models", [])
-                # Mark as remote models
-                for model in remote_models:
-                    model["type"] = "remote"
-                all_models.extend(remote_models)
+            data = _read_json(models_file)
+            remote_models = [{**m, "type": "remote"} for m in data.get("models", [])]
     except Exception as e:
         console.print(f"[yellow]Warning: Could not load models.json: {e}[/yellow]")
     
     # If no models found, use fallback
-    if not all_models:
-        all_models = [{"id": "x-ai/grok-4-fast:free", "name": "Grok 4 Fast (Free)", "description": "Default model", "type": "remote"}]
+    if not ollama_models and not remote_models:
+        remote_models = [{"id": "x-ai/grok-4-fast:free", "name": "Grok 4 Fast (Free)", "description": "Default model", "type": "remote"}]
     
-    return all_models
+    return ModelCatalog(local=list(ollama_models), remote=remote_models)
 
 
 def load_user_settings() -> Dict:
@@ -111,8 +271,7 @@ def load_user_settings() -> Dict:
     settings_path = BASE_DIR / "config.json"
     if settings_path.exists():
         try:
-            with open(settings_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return _read_json(settings_path)
         except Exception:
             return {}
     return {}
@@ -122,15 +281,24 @@ def save_user_settings(settings: Dict) -> None:
     """Persist user settings to config.json"""
     settings_path = BASE_DIR / "config.json"
     try:
-        with open(settings_path, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=2)
+        _write_json_atomic(settings_path, settings)
     except Exception as e:
         console.print(f"[yellow]Ayarlar kaydedilemedi: {e}[/yellow]")
 
 
-def select_model(key_store: Optional[KeyStore] = None, current_model: Optional[str] = None) -> str:
+@dataclass
+class AppState:
+    """Session state shared by the REPL, the model menu and AI clients"""
+    api_key: Optional[str] = None
+    model: Optional[str] = None
+    key_store: Optional[KeyStore] = None
+
+
+def select_model(state: AppState) -> str:
     """Model/anahtar menüsü: Modelleri listele veya kullanıcı API anahtarı gir"""
-    models = load_models()
+    current_model = state.model
+    catalog = load_models()
+    models = catalog.all
     
     console.print("\n[bold #C8A882]═══ Model / API Anahtarı Menüsü ═══[/bold #C8A882]\n")
     console.print("[#C8A882]1.[/#C8A882] Modelleri Listele")
@@ -140,11 +308,12 @@ def select_model(key_store: Optional[KeyStore] = None, current_model: Optional[s
     
     if top_choice.strip() == "2":
         # Enter user's OpenRouter API key
-        if key_store is None:
+        if state.key_store is None:
             try:
-                key_store = KeyStore()
+                state.key_store = get_key_store()
             except Exception:
                 pass
+        key_store = state.key_store
         api_key_input = Prompt.ask("OpenRouter API Anahtarı (sk-or-...)")
         if not api_key_input or not api_key_input.strip().startswith("sk-or-"):
             console.print("[red]Geçersiz anahtar. OpenRouter anahtarı 'sk-or-' ile başlamalıdır.[/red]")
@@ -155,15 +324,11 @@ def select_model(key_store: Optional[KeyStore] = None, current_model: Optional[s
             settings = load_user_settings()
             settings["use_user_key"] = True
             save_user_settings(settings)
-            # Also update process env and module-level API_KEY so remote calls can fall back if needed
-            try:
-                import os as _os
-                global API_KEY
-                API_KEY = api_key_input.strip()
-                _os.environ["AI_API_KEY"] = API_KEY
-            except Exception:
-                pass
-            console.print("[green]✓ Anahtar şifrelendi ve yerel olarak kaydedildi. Uzaktaki modeller artık sizin anahtarınızla kullanılacak.[/green]")
+            # Also keep it as the session fallback key so remote calls work even if the store is unreadable,
+            # and export it so commands and dev servers started from this session inherit it
+            state.api_key = api_key_input.strip()
+            os.environ["AI_API_KEY"] = state.api_key
+            _print_status("✓ Anahtar şifrelendi ve yerel olarak kaydedildi. Uzaktaki modeller artık sizin anahtarınızla kullanılacak.", "green")
         except Exception as e:
             console.print(f"[red]Anahtar kaydedilemedi: {e}[/red]")
         # Keep current model unchanged
@@ -171,9 +336,9 @@ def select_model(key_store: Optional[KeyStore] = None, current_model: Optional[s
     
     # Otherwise: list models and select
     console.print("\n[bold #C8A882]═══ Model Seçimi ═══[/bold #C8A882]\n")
-    local_models = [m for m in models if m.get("type") == "local"]
-    remote_models = [m for m in models if m.get("type") == "remote"]
-    display_models = local_models + remote_models
+    local_models = catalog.local
+    remote_models = catalog.remote
+    display_models = models
     
     if local_models:
         console.print("[bold green]🏠 Lokal Modeller (Ollama):[/bold green]\n")
@@ -204,6 +369,7 @@ def select_model(key_store: Optional[KeyStore] = None, current_model: Optional[s
                 settings["active_model_id"] = selected_model["id"]
                 settings["active_model_name"] = selected_model["name"]
                 save_user_settings(settings)
+                state.model = selected_model["id"]
                 return selected_model["id"]
             else:
                 console.print(f"[red]Lütfen 1-{len(display_models)} arasında bir sayı girin[/red]")
@@ -217,73 +383,388 @@ def select_model(key_store: Optional[KeyStore] = None, current_model: Optional[s
 class ProjectState:
     """Manages project state persistence for long-term projects"""
     
+    # Characters allowed in a project id; none of them can form a path separator or ".."
+    _ID_OK = frozenset(string.ascii_letters + string.digits + "_-")
+    _ID_MAX_LEN = 128
+    # Resolved and created project dirs, keyed by (cwd, project_dir) since relative dirs depend on cwd
+    _dirs: Dict[tuple, Path] = {}
+    
     def __init__(self, project_dir: str = ".cli_projects"):
-        self.project_dir = Path(project_dir).resolve()
-        self.project_dir.mkdir(exist_ok=True)
+        key = (os.getcwd(), str(project_dir))
+        resolved = ProjectState._dirs.get(key)
+        if resolved is None:
+            resolved = Path(project_dir).resolve()
+            resolved.mkdir(exist_ok=True)
+            ProjectState._dirs[key] = resolved
+        self.project_dir = resolved
+        # Saves may finish on worker threads; a sequence number per save keeps
+        # an older snapshot from overwriting a newer one
+        self._save_lock = threading.Lock()
+        self._save_seq = count()
+        self._written_seq: Dict[str, int] = {}
+        # "<id>.json" -> ((mtime_ns, size), list summary), invalidated per file;
+        # only the small summaries are held, never whole project documents
+        self._list_cache: Dict[str, tuple] = {}
     
     def _validate_project_id(self, project_id: str) -> bool:
         """Validate project_id to prevent path traversal attacks"""
-        if not re.match(r'^[A-Za-z0-9_-]+$', project_id):
+        # The charset alone keeps "<id>.json" inside project_dir, so no resolve() is needed
+        if not project_id or len(project_id) > self._ID_MAX_LEN:
             return False
-        project_file = (self.project_dir / f"{project_id}.json").resolve()
-        return self.project_dir in project_file.parents
+        return self._ID_OK.issuperset(project_id)
+    
+    def _commit(self, project_id: str, payload: bytes, seq: int) -> None:
+        with self._save_lock:
+            if seq < self._written_seq.get(project_id, -1):
+                return
+            _write_bytes_atomic(self.project_dir / f"{project_id}.json", payload)
+            self._written_seq[project_id] = seq
+        # Same-tick rewrites can keep the old mtime; never serve a stale summary
+        self._list_cache.pop(f"{project_id}.json", None)
     
     def save_project(self, project_id: str, data: Dict):
         """Save project state to file"""
         if not self._validate_project_id(project_id):
             raise ValueError(f"Invalid project ID: {project_id}")
-        project_file = self.project_dir / f"{project_id}.json"
-        with open(project_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        self._commit(project_id, _json_dumps(data), next(self._save_seq))
+    
+    async def save_project_async(self, project_id: str, data: Dict):
+        """Save project state with the file write done off the event loop"""
+        if not self._validate_project_id(project_id):
+            raise ValueError(f"Invalid project ID: {project_id}")
+        # Serialize here so the snapshot is taken before other tasks mutate data
+        payload = _json_dumps(data)
+        await asyncio.to_thread(self._commit, project_id, payload, next(self._save_seq))
     
     def load_project(self, project_id: str) -> Optional[Dict]:
         """Load project state from file"""
         if not self._validate_project_id(project_id):
             return None
-        project_file = self.project_dir / f"{project_id}.json"
-        if project_file.exists():
-            with open(project_file, 'r') as f:
-                return json.load(f)
-        return None
+        try:
+            return _read_json(self.project_dir / f"{project_id}.json")
+        except FileNotFoundError:
+            return None
+    
+    def project_exists(self, project_id: str) -> bool:
+        """Check for a saved project without reading it"""
+        if not self._validate_project_id(project_id):
+            return False
+        return os.path.isfile(self.project_dir / f"{project_id}.json")
+    
+    def _read_one(self, entry: os.DirEntry) -> Optional[Dict]:
+        """Summarize one saved project file (None if unreadable)"""
+        try:
+            st = entry.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+            cached = self._list_cache.get(entry.name)
+            if cached is not None and cached[0] == sig:
+                return cached[1]
+            data = _read_json(entry.path)
+            steps_list = data.get("steps", [])
+            cur_step = data.get("current_step", 0)
+            sub_map = data.get("substeps_map", {})
+            next_step = cur_step + 1 if cur_step < len(steps_list) else cur_step
+            sub_total = len(sub_map.get(str(next_step), [])) if isinstance(sub_map, dict) else 0
+            cur_sub = data.get("current_substep", 0) if sub_total > 0 else 0
+            summary = {
+                "id": entry.name[:-5],
+                "name": data.get("task_name", "Unknown"),
+                "created": data.get("created_at", "Unknown"),
+                "status": data.get("status", "Unknown"),
+                "current_step": cur_step,
+                "total_steps": len(steps_list),
+                "subprogress": f"{cur_sub}/{sub_total}" if sub_total > 0 else "-"
+            }
+            self._list_cache[entry.name] = (sig, summary)
+            return summary
+        except Exception:
+            return None
+    
+    def _project_entries(self) -> List[os.DirEntry]:
+        # scandir entries carry the file type, so no Path objects or extra stats are needed to filter
+        try:
+            with os.scandir(self.project_dir) as it:
+                return [e for e in it if e.name.endswith(".json") and e.is_file()]
+        except OSError:
+            return []
     
     def list_projects(self) -> List[Dict]:
         """List all saved projects"""
-        projects = []
-        for project_file in self.project_dir.glob("*.json"):
-            try:
-                with open(project_file, 'r') as f:
-                    data = json.load(f)
-                    steps_list = data.get("steps", [])
-                    cur_step = data.get("current_step", 0)
-                    sub_map = data.get("substeps_map", {})
-                    next_step = cur_step + 1 if cur_step < len(steps_list) else cur_step
-                    sub_total = len(sub_map.get(str(next_step), [])) if isinstance(sub_map, dict) else 0
-                    cur_sub = data.get("current_substep", 0) if sub_total > 0 else 0
-                    projects.append({
-                        "id": project_file.stem,
-                        "name": data.get("task_name", "Unknown"),
-                        "created": data.get("created_at", "Unknown"),
-                        "status": data.get("status", "Unknown"),
-                        "current_step": cur_step,
-                        "total_steps": len(steps_list),
-                        "subprogress": f"{cur_sub}/{sub_total}" if sub_total > 0 else "-"
-                    })
-            except Exception:
-                pass
+        projects = [p for p in map(self._read_one, self._project_entries()) if p]
+        return sorted(projects, key=lambda x: x.get("created", ""), reverse=True)
+    
+    async def list_projects_async(self) -> List[Dict]:
+        """List all saved projects, reading the files concurrently off the event loop"""
+        entries = self._project_entries()
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._read_one, e) for e in entries),
+            return_exceptions=True
+        )
+        projects = [r for r in results if isinstance(r, dict)]
         return sorted(projects, key=lambda x: x.get("created", ""), reverse=True)
     
     def delete_project(self, project_id: str):
         """Delete a project"""
         if not self._validate_project_id(project_id):
             raise ValueError(f"Invalid project ID: {project_id}")
-        project_file = self.project_dir / f"{project_id}.json"
-        if project_file.exists():
-            project_file.unlink()
+        (self.project_dir / f"{project_id}.json").unlink(missing_ok=True)
+        self._list_cache.pop(f"{project_id}.json", None)
+
+
+# Directive patterns recognised in AI responses, combined so a response is
+# scanned once and directives are handled in the order they appear
+_DIRECTIVE_RE = re.compile(
+    r'(?P<file>CREATE_FILE:\s*(?P<file_path>[^\n]+)\s*```(?:\w+)?\s*(?P<file_body>.*?)```)'
+    r'|(?P<project>CREATE_PROJECT:\s*(?P<project_name>[^\n]+)\s*```json\s*(?P<project_body>.*?)```)'
+    r'|(?P<folder>CREATE_FOLDER:\s*(?P<folder_path>[^\n]+))'
+    r'|(?P<launch>LAUNCH:\s*(?P<launch_arg>[^\n]+))'
+    r'|(?P<run_bg>RUN_BG:\s*(?P<run_bg_arg>[^\n]+))'
+    r'|(?P<stop_bg>STOP_BG:\s*(?P<stop_bg_arg>\S+))'
+    r'|(?P<restart_bg>RESTART_BG:\s*(?P<restart_bg_arg>\S+))'
+    r'|(?P<run>RUN(?:_TEST|_COMMAND)?:\s*(?P<run_arg>[^\n]+))',
+    re.DOTALL
+)
+_SYNC_DIRECTIVES = frozenset(("file", "project", "folder"))
+# Every directive contains one of these literals; text without any is not regex-scanned
+_DIRECTIVE_TRIGGERS = ("CREATE_", "RUN", "LAUNCH:", "STOP_BG:", "RESTART_BG:")
+_TRIGGER_RE = re.compile("|".join(map(re.escape, _DIRECTIVE_TRIGGERS)))
+_TRIGGER_MAX = max(map(len, _DIRECTIVE_TRIGGERS))
+# Literal starts of the directives: block ones end with a closing fence, the
+# rest at a line break or whitespace
+_BLOCK_HEADS = ("CREATE_FILE:", "CREATE_PROJECT:")
+_DIRECTIVE_HEADS = _BLOCK_HEADS + (
+    "CREATE_FOLDER:", "LAUNCH:", "RUN_BG:", "STOP_BG:", "RESTART_BG:",
+    "RUN:", "RUN_TEST:", "RUN_COMMAND:",
+)
+_HEAD_MAX = max(map(len, _DIRECTIVE_HEADS))
+# Max CREATE_* operations run at once by the async parser
+_FILE_OP_CONCURRENCY = 8
+# Skip verification diffs above this combined size; cap diff output lines
+_DIFF_MAX_BYTES = 1024 * 1024
+_DIFF_MAX_LINES = 5000
+# Characters of output kept per stream for RUN: directives
+_RUN_OUTPUT_CHARS = 4000
+# Bytes kept from the end of each stream, so an error printed last is still
+# seen by error classification and by the step loop
+_RUN_TAIL_BYTES = 16 * 1024
+
+
+class _DirectiveScanner:
+    """Finds directives in a streamed response that the rest of the stream cannot change.
+
+    Call scan() with the whole text received so far after every chunk. Each
+    call resumes where the previous one stopped, so the total cost stays
+    linear in the response length however finely it is chunked. Matches are
+    the same the full-text _DIRECTIVE_RE scan would produce; whatever is left
+    from pos on is for a final finditer once the stream ends.
+    """
+
+    def __init__(self):
+        # Everything before pos has been returned or holds no directive
+        self.pos = 0
+        # Start of an unclosed CREATE_FILE/CREATE_PROJECT block, or -1
+        self._block = -1
+        self._head_done = False
+        # Where the next newline/fence search inside that block resumes
+        self._scan_from = 0
+
+    def scan(self, text: str) -> list:
+        ready = []
+        while True:
+            if self._block >= 0:
+                match = self._close_block(text)
+                if match is None:
+                    return ready
+                ready.append(match)
+                self.pos = match.end()
+                self._block = -1
+                continue
+            trigger = _TRIGGER_RE.search(text, self.pos)
+            if trigger is None:
+                # Keep a trigger cut off at the end of the text in view
+                self.pos = max(self.pos, len(text) - _TRIGGER_MAX + 1)
+                return ready
+            start = trigger.start()
+            if text.startswith(_BLOCK_HEADS, start):
+                # Later directives may turn out to be inside this block
+                self.pos = self._block = self._scan_from = start
+                self._head_done = False
+                continue
+            match = _DIRECTIVE_RE.match(text, start)
+            if match is not None:
+                if match.end() >= len(text):
+                    # The argument may still grow
+                    self.pos = start
+                    return ready
+                ready.append(match)
+                self.pos = match.end()
+            elif self._may_become_directive(text, start):
+                self.pos = start
+                return ready
+            else:
+                self.pos = start + 1
+
+    def _close_block(self, text: str):
+        """Match the open block once its closing fence has arrived (None until then)"""
+        start = self._block
+        if not self._head_done:
+            # The path runs to the end of the head line
+            nl = text.find("\n", self._scan_from)
+            if nl < 0:
+                self._scan_from = len(text)
+                return None
+            self._head_done = True
+            self._scan_from = start
+        while True:
+            fence = text.find("```", self._scan_from)
+            if fence < 0:
+                # A fence may be split across chunks
+                self._scan_from = max(self._scan_from, len(text) - 2)
+                return None
+            self._scan_from = fence + 1
+            # Only re-run the pattern when a new fence shows up
+            match = _DIRECTIVE_RE.match(text, start)
+            if match is not None:
+                return match
+
+    @staticmethod
+    def _may_become_directive(text: str, start: int) -> bool:
+        """Whether more text could still make a directive match at start"""
+        rest = text[start:start + _HEAD_MAX]
+        for head in _DIRECTIVE_HEADS:
+            if len(rest) < len(head):
+                if head.startswith(rest):
+                    return True
+            elif rest.startswith(head):
+                # Only line breaks after the head so far: the argument is still to come
+                return not text[start + len(head):].strip()
+        return False
 
 
 class ResponseParser:
     """Parses AI responses and extracts file operations"""
     
+    @staticmethod
+    def _create_file(results: Dict, file_path: str, content: str) -> None:
+        # If file exists, compute a unified diff for verification
+        try:
+            try:
+                f = open(file_path, 'rb')
+            except FileNotFoundError:
+                f = None
+            if f is not None:
+                with f:
+                    too_large = os.fstat(f.fileno()).st_size + len(content) > _DIFF_MAX_BYTES
+                    raw = None if too_large else f.read()
+                if too_large:
+                    results["diffs"].append({"file": file_path, "diff": "<skipped: too large>"})
+                elif b'\x00' in raw[:8192]:
+                    results["diffs"].append({"file": file_path, "diff": "<skipped: binary>"})
+                else:
+                    import difflib
+                    diff_lines = difflib.unified_diff(
+                        raw.decode('utf-8', errors='ignore').splitlines(),
+                        content.splitlines(),
+                        fromfile=f"old:{file_path}",
+                        tofile=f"new:{file_path}",
+                        lineterm=''
+                    )
+                    diff_text = '\n'.join(islice(diff_lines, _DIFF_MAX_LINES))
+                    if next(diff_lines, None) is not None:
+                        diff_text += '\n... [diff truncated]'
+                    if diff_text.strip():
+                        results["diffs"].append({"file": file_path, "diff": diff_text})
+        except Exception as e:
+            # Diff calculation should not block file creation
+            results["errors"].append(f"Diff error for {file_path}: {str(e)}")
+        
+        # Ensure parent folder and pre-create file synchronously before writing
+        try:
+            parent = str(Path(file_path).parent)
+            if parent:
+                execute_safe_command("create_folder", folder_path=parent)
+            pre = execute_safe_command("create_empty_file", file_path=file_path, create_dirs=True)
+            if not pre.get("success") and not pre.get("already_exists"):
+                results["errors"].append(f"Failed to pre-create {file_path}: {pre.get('error')}")
+        except Exception as e:
+            results["errors"].append(f"Pre-create error for {file_path}: {str(e)}")
+        
+        # Write content to the already existing file
+        result = execute_safe_command("write_file", file_path=file_path, content=content)
+        if result.get("success"):
+            results["files_created"].append(file_path)
+            results["operations"] += 1
+        else:
+            results["errors"].append(f"Failed to write {file_path}: {result.get('error')}")
+    
+    @staticmethod
+    def _create_project(results: Dict, project_name: str, body: str) -> None:
+        try:
+            structure = json.loads(body)
+            result = execute_safe_command("create_project_structure", 
+                                          project_name=project_name, 
+                                          structure=structure)
+            if result.get("success"):
+                results["folders_created"].append(project_name)
+                results["operations"] += 1
+            else:
+                results["errors"].append(f"Failed to create project {project_name}: {result.get('error')}")
+        except json.JSONDecodeError as e:
+            results["errors"].append(f"Invalid JSON for project {project_name}: {str(e)}")
+    
+    @staticmethod
+    def _create_folder(results: Dict, folder_path: str) -> None:
+        result = execute_safe_command("create_folder", folder_path=folder_path)
+        if result.get("success"):
+            results["folders_created"].append(folder_path)
+            results["operations"] += 1
+        else:
+            results["errors"].append(f"Failed to create folder {folder_path}: {result.get('error')}")
+    
+    @staticmethod
+    def _apply_sync(results: Dict, match) -> None:
+        """Handle a CREATE_FILE / CREATE_PROJECT / CREATE_FOLDER match"""
+        kind = match.lastgroup
+        if kind == "file":
+            ResponseParser._create_file(results, match.group("file_path").strip(), match.group("file_body").strip())
+        elif kind == "project":
+            ResponseParser._create_project(results, match.group("project_name").strip(), match.group("project_body").strip())
+        else:
+            ResponseParser._create_folder(results, match.group("folder_path").strip())
+    
+    @staticmethod
+    def _target_parts(match) -> tuple:
+        """Path components a CREATE_* match writes to, normalised for comparison"""
+        kind = match.lastgroup
+        target = (match.group(kind + "_path") if kind != "project" else match.group("project_name")).strip()
+        return Path(os.path.normcase(os.path.abspath(target))).parts
+
+    @staticmethod
+    async def _apply_sync_batch(results: Dict, matches: List) -> None:
+        """Run consecutive CREATE_* matches concurrently in worker threads.
+        
+        Each operation records into its own partial result, merged back in
+        document order once the batch completes.
+        """
+        sem = asyncio.Semaphore(_FILE_OP_CONCURRENCY)
+        
+        async def _bounded(match) -> Dict:
+            async with sem:
+                part = {"files_created": [], "folders_created": [], "errors": [], "operations": 0, "diffs": []}
+                await asyncio.to_thread(ResponseParser._apply_sync, part, match)
+                return part
+        
+        parts = await asyncio.gather(*(_bounded(m) for m in matches), return_exceptions=True)
+        for part in parts:
+            if isinstance(part, asyncio.CancelledError):
+                raise part
+            if isinstance(part, BaseException):
+                results["errors"].append(f"Parser error: {str(part)}")
+                continue
+            results["operations"] += part.pop("operations")
+            for key, items in part.items():
+                results[key].extend(items)
+    
     @staticmethod
     def parse_and_execute(response: str) -> Dict:
         """Parse AI response and execute file operations"""
@@ -296,86 +777,180 @@ class ResponseParser:
         }
         
         try:
-            # Pattern 1: CREATE_FILE: path/to/file.ext
-            file_pattern = r'CREATE_FILE:\s*([^\n]+)\s*```(\w+)?\s*(.*?)```'
-            for match in re.finditer(file_pattern, response, re.DOTALL):
-                file_path = match.group(1).strip()
-                content = match.group(3).strip()
-                
-                # If file exists, compute a unified diff for verification
-                try:
-                    if os.path.exists(file_path):
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            old_content = f.read()
-                        diff_text = '\n'.join(difflib.unified_diff(
-                            old_content.splitlines(),
-                            content.splitlines(),
-                            fromfile=f"old:{file_path}",
-                            tofile=f"new:{file_path}",
-                            lineterm=''
-                        ))
-                        if diff_text.strip():
-                            results["diffs"].append({"file": file_path, "diff": diff_text})
-                except Exception as e:
-                    # Diff calculation should not block file creation
-                    results["errors"].append(f"Diff error for {file_path}: {str(e)}")
-                
-                # Ensure parent folder and pre-create file synchronously before writing
-                try:
-                    parent = str(Path(file_path).parent)
-                    if parent:
-                        execute_safe_command("create_folder", folder_path=parent)
-                    pre = execute_safe_command("create_empty_file", file_path=file_path, create_dirs=True)
-                    if not pre.get("success") and not pre.get("already_exists"):
-                        results["errors"].append(f"Failed to pre-create {file_path}: {pre.get('error')}")
-                except Exception as e:
-                    results["errors"].append(f"Pre-create error for {file_path}: {str(e)}")
-                
-                # Write content to the already existing file
-                result = execute_safe_command("write_file", file_path=file_path, content=content)
-                if result.get("success"):
-                    results["files_created"].append(file_path)
-                    results["operations"] += 1
-                else:
-                    results["errors"].append(f"Failed to write {file_path}: {result.get('error')}")
-            
-            # Pattern 2: CREATE_PROJECT: project_name with JSON structure
-            project_pattern = r'CREATE_PROJECT:\s*([^\n]+)\s*```json\s*(.*?)```'
-            for match in re.finditer(project_pattern, response, re.DOTALL):
-                project_name = match.group(1).strip()
-                try:
-                    structure = json.loads(match.group(2).strip())
-                    result = execute_safe_command("create_project_structure", 
-                                                  project_name=project_name, 
-                                                  structure=structure)
-                    if result.get("success"):
-                        results["folders_created"].append(project_name)
-                        results["operations"] += 1
-                    else:
-                        results["errors"].append(f"Failed to create project {project_name}: {result.get('error')}")
-                except json.JSONDecodeError as e:
-                    results["errors"].append(f"Invalid JSON for project {project_name}: {str(e)}")
-            
-            # Pattern 3: CREATE_FOLDER: path/to/folder
-            folder_pattern = r'CREATE_FOLDER:\s*([^\n]+)'
-            for match in re.finditer(folder_pattern, response):
-                folder_path = match.group(1).strip()
-                result = execute_safe_command("create_folder", folder_path=folder_path)
-                if result.get("success"):
-                    results["folders_created"].append(folder_path)
-                    results["operations"] += 1
-                else:
-                    results["errors"].append(f"Failed to create folder {folder_path}: {result.get('error')}")
-                    
+            for match in _DIRECTIVE_RE.finditer(response):
+                if match.lastgroup in _SYNC_DIRECTIVES:
+                    ResponseParser._apply_sync(results, match)
         except Exception as e:
             results["errors"].append(f"Parser error: {str(e)}")
         
         return results
+    
+    @staticmethod
+    async def _launch(results: Dict, token: str) -> None:
+        # LAUNCH: auto => auto-detect project and start dev server, parse local address
+        try:
+            if token.lower() == "auto":
+                launch_res = await execute_safe_command_async("launch_auto", cwd=str(Path.cwd()))
+                results["operations"] += 1
+                results.setdefault("launches", []).append({
+                    "mode": "auto",
+                    "success": launch_res.get("success"),
+                    "address": launch_res.get("address"),
+                    "pid": launch_res.get("pid"),
+                    "command": launch_res.get("command"),
+                    "error": launch_res.get("error"),
+                })
+                if not launch_res.get("success") and launch_res.get("error"):
+                    results["errors"].append(f"Launch error: {launch_res.get('error')}")
+            else:
+                # Treat LAUNCH: <command> as explicit background process
+                bg_res = await execute_safe_command_async("run_command_bg", command=token, cwd=str(Path.cwd()))
+                results["operations"] += 1
+                results.setdefault("processes", []).append({
+                    "command": token,
+                    "success": bg_res.get("success"),
+                    "pid": bg_res.get("pid"),
+                    "error": bg_res.get("error"),
+                })
+                if not bg_res.get("success") and bg_res.get("error"):
+                    results["errors"].append(f"Launch error: {bg_res.get('error')}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            results["errors"].append(f"Launch execution failed: {str(e)}")
+    
+    @staticmethod
+    async def _run_bg(results: Dict, cmd: str) -> None:
+        try:
+            bg_res = await execute_safe_command_async("run_command_bg", command=cmd, cwd=str(Path.cwd()))
+            results["operations"] += 1
+            results.setdefault("processes", []).append({
+                "command": cmd,
+                "success": bg_res.get("success"),
+                "pid": bg_res.get("pid"),
+                "error": bg_res.get("error"),
+            })
+            if not bg_res.get("success") and bg_res.get("error"):
+                results["errors"].append(f"Background run error: {bg_res.get('error')}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            results["errors"].append(f"Background run failed: {str(e)}")
+    
+    @staticmethod
+    async def _stop_bg(results: Dict, target: str) -> None:
+        try:
+            stop_res = await execute_safe_command_async("stop_process", pid=target)
+            results["operations"] += 1
+            results.setdefault("stops", []).append({
+                "target": target,
+                "success": stop_res.get("success"),
+                "error": stop_res.get("error"),
+            })
+            if not stop_res.get("success") and stop_res.get("error"):
+                results["errors"].append(f"Stop error: {stop_res.get('error')}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            results["errors"].append(f"Stop failed: {str(e)}")
+    
+    @staticmethod
+    async def _restart_bg(results: Dict, target: str) -> None:
+        try:
+            restart_res = await execute_safe_command_async("restart_process", pid=target)
+            results["operations"] += 1
+            results.setdefault("restarts", []).append({
+                "target": target,
+                "success": restart_res.get("success"),
+                "pid": restart_res.get("pid"),
+                "error": restart_res.get("error"),
+            })
+            if not restart_res.get("success") and restart_res.get("error"):
+                results["errors"].append(f"Restart error: {restart_res.get('error')}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            results["errors"].append(f"Restart failed: {str(e)}")
+    
+    @staticmethod
+    async def _run(results: Dict, command: str) -> None:
+        # Run with cancellation support
+        try:
+            # Reading buffers enough bytes for _RUN_OUTPUT_CHARS UTF-8 characters
+            # from the start of each stream plus a _RUN_TAIL_BYTES tail
+            run_res = await execute_safe_command_async(
+                "run_command", command=command,
+                max_head_bytes=4 * _RUN_OUTPUT_CHARS, max_tail_bytes=_RUN_TAIL_BYTES
+            )
+            stderr = run_res.get("stderr", "")
+            if len(stderr) > 2 * _RUN_OUTPUT_CHARS:
+                # Tracebacks come last, so keep the end of stderr as well as the start
+                stderr = f"{stderr[:_RUN_OUTPUT_CHARS]}\n...\n{stderr[-_RUN_OUTPUT_CHARS:]}"
+            results["commands_run"].append({
+                "command": command,
+                "success": run_res.get("success"),
+                "exit_code": run_res.get("exit_code"),
+                "stdout": run_res.get("stdout", "")[:_RUN_OUTPUT_CHARS],
+                "stderr": stderr,
+                "error": run_res.get("error")
+            })
+            results["operations"] += 1
+            if not run_res.get("success") and run_res.get("error"):
+                results["errors"].append(f"Run error: {run_res.get('error')}")
+        except asyncio.CancelledError:
+            # If sub-step is cancelled while running command, propagate
+            raise
+        except Exception as e:
+            results["errors"].append(f"Run execution failed: {str(e)}")
 
     @staticmethod
-    async def parse_and_execute_async(response: str) -> Dict:
-        """Async parser to execute file operations and safe run commands."""
-        results = {
+    async def _execute_matches(results: Dict, matches) -> None:
+        """Execute directive matches in order, recording into results"""
+        try:
+            # Consecutive CREATE_* directives are batched and run concurrently;
+            # commands act as ordering barriers so they still see every file
+            # declared before them.
+            batch: List = []
+            # Normalised target paths in the batch, and every ancestor of them
+            batch_targets = set()
+            batch_ancestors = set()
+            for match in matches:
+                kind = match.lastgroup
+                if kind in _SYNC_DIRECTIVES:
+                    target = ResponseParser._target_parts(match)
+                    prefixes = [target[:n] for n in range(1, len(target))]
+                    if target in batch_ancestors or target in batch_targets or not batch_targets.isdisjoint(prefixes):
+                        # Same path, or one inside the other: keep the writes ordered
+                        await ResponseParser._apply_sync_batch(results, batch)
+                        batch, batch_targets, batch_ancestors = [], set(), set()
+                    batch.append(match)
+                    batch_targets.add(target)
+                    batch_ancestors.update(prefixes)
+                    continue
+                if batch:
+                    await ResponseParser._apply_sync_batch(results, batch)
+                    batch, batch_targets, batch_ancestors = [], set(), set()
+                if kind == "launch":
+                    await ResponseParser._launch(results, match.group("launch_arg").strip())
+                elif kind == "run_bg":
+                    await ResponseParser._run_bg(results, match.group("run_bg_arg").strip())
+                elif kind == "stop_bg":
+                    await ResponseParser._stop_bg(results, match.group("stop_bg_arg").strip())
+                elif kind == "restart_bg":
+                    await ResponseParser._restart_bg(results, match.group("restart_bg_arg").strip())
+                else:
+                    await ResponseParser._run(results, match.group("run_arg").strip())
+            if batch:
+                await ResponseParser._apply_sync_batch(results, batch)
+        except asyncio.CancelledError:
+            # Propagate cancellation
+            raise
+        except Exception as e:
+            results["errors"].append(f"Async parser error: {str(e)}")
+
+    @staticmethod
+    def _new_async_results() -> Dict:
+        return {
             "files_created": [],
             "folders_created": [],
             "errors": [],
@@ -383,156 +958,116 @@ class ResponseParser:
             "diffs": [],
             "commands_run": []
         }
-        
-        try:
-            # Reuse synchronous parsing for file/folder/project creation
-            sync_results = ResponseParser.parse_and_execute(response)
-            for k in ["files_created", "folders_created", "errors", "operations", "diffs"]:
-                if k == "operations":
-                    results["operations"] += sync_results.get(k, 0)
-                else:
-                    results[k].extend(sync_results.get(k, []))
-            
-            # Pattern 4: LAUNCH auto and background process commands
-            # LAUNCH: auto => auto-detect project and start dev server, parse local address
-            launch_pattern = r'LAUNCH:\s*([^\n]+)'
-            for match in re.finditer(launch_pattern, response):
-                token = match.group(1).strip()
-                try:
-                    if token.lower() == "auto":
-                        launch_res = await execute_safe_command_async("launch_auto", cwd=str(Path.cwd()))
-                        results["operations"] += 1
-                        results.setdefault("launches", []).append({
-                            "mode": "auto",
-                            "success": launch_res.get("success"),
-                            "address": launch_res.get("address"),
-                            "pid": launch_res.get("pid"),
-                            "command": launch_res.get("command"),
-                            "error": launch_res.get("error"),
-                        })
-                        if not launch_res.get("success") and launch_res.get("error"):
-                            results["errors"].append(f"Launch error: {launch_res.get('error')}")
-                    else:
-                        # Treat LAUNCH: <command> as explicit background process
-                        bg_res = await execute_safe_command_async("run_command_bg", command=token, cwd=str(Path.cwd()))
-                        results["operations"] += 1
-                        results.setdefault("processes", []).append({
-                            "command": token,
-                            "success": bg_res.get("success"),
-                            "pid": bg_res.get("pid"),
-                            "error": bg_res.get("error"),
-                        })
-                        if not bg_res.get("success") and bg_res.get("error"):
-                            results["errors"].append(f"Launch error: {bg_res.get('error')}")
-                except asyncio.CancelledError:
-                    raise
-                except Exception as e:
-                    results["errors"].append(f"Launch execution failed: {str(e)}")
-
-            # Pattern 5: RUN_BG / STOP_BG / RESTART_BG
-            bg_run_pattern = r'RUN_BG:\s*([^\n]+)'
-            for match in re.finditer(bg_run_pattern, response):
-                cmd = match.group(1).strip()
-                try:
-                    bg_res = await execute_safe_command_async("run_command_bg", command=cmd, cwd=str(Path.cwd()))
-                    results["operations"] += 1
-                    results.setdefault("processes", []).append({
-                        "command": cmd,
-                        "success": bg_res.get("success"),
-                        "pid": bg_res.get("pid"),
-                        "error": bg_res.get("error"),
-                    })
-                    if not bg_res.get("success") and bg_res.get("error"):
-                        results["errors"].append(f"Background run error: {bg_res.get('error')}")
-                except asyncio.CancelledError:
-                    raise
-                except Exception as e:
-                    results["errors"].append(f"Background run failed: {str(e)}")
 
-            stop_bg_pattern = r'STOP_BG:\s*(\S+)'
-            for match in re.finditer(stop_bg_pattern, response):
-                target = match.group(1).strip()
-                try:
-                    stop_res = await execute_safe_command_async("stop_process", pid=target)
-                    results["operations"] += 1
-                    results.setdefault("stops", []).append({
-                        "target": target,
-                        "success": stop_res.get("success"),
-                        "error": stop_res.get("error"),
-                    })
-                    if not stop_res.get("success") and stop_res.get("error"):
-                        results["errors"].append(f"Stop error: {stop_res.get('error')}")
-                except asyncio.CancelledError:
-                    raise
-                except Exception as e:
-                    results["errors"].append(f"Stop failed: {str(e)}")
-
-            restart_bg_pattern = r'RESTART_BG:\s*(\S+)'
-            for match in re.finditer(restart_bg_pattern, response):
-                target = match.group(1).strip()
-                try:
-                    restart_res = await execute_safe_command_async("restart_process", pid=target)
-                    results["operations"] += 1
-                    results.setdefault("restarts", []).append({
-                        "target": target,
-                        "success": restart_res.get("success"),
-                        "pid": restart_res.get("pid"),
-                        "error": restart_res.get("error"),
-                    })
-                    if not restart_res.get("success") and restart_res.get("error"):
-                        results["errors"].append(f"Restart error: {restart_res.get('error')}")
-                except asyncio.CancelledError:
-                    raise
-                except Exception as e:
-                    results["errors"].append(f"Restart failed: {str(e)}")
+    @staticmethod
+    async def parse_and_execute_async(response: str) -> Dict:
+        """Async parser to execute file operations and safe run commands."""
+        results = ResponseParser._new_async_results()
+        if not any(tok in response for tok in _DIRECTIVE_TRIGGERS):
+            return results
+        # Single pass over the response
+        await ResponseParser._execute_matches(results, _DIRECTIVE_RE.finditer(response))
+        return results
 
-            # Pattern 6: RUN / RUN_TEST commands
-            run_pattern = r'RUN(?:_TEST|_COMMAND)?:\s*([^\n]+)'
-            for match in re.finditer(run_pattern, response):
-                command = match.group(1).strip()
-                # Run with cancellation support
-                try:
-                    run_res = await execute_safe_command_async("run_command", command=command)
-                    results["commands_run"].append({
-                        "command": command,
-                        "success": run_res.get("success"),
-                        "exit_code": run_res.get("exit_code"),
-                        "stdout": run_res.get("stdout", "")[:4000],
-                        "stderr": run_res.get("stderr", "")[:4000],
-                        "error": run_res.get("error")
-                    })
-                    results["operations"] += 1
-                    if not run_res.get("success") and run_res.get("error"):
-                        results["errors"].append(f"Run error: {run_res.get('error')}")
-                except asyncio.CancelledError:
-                    # If sub-step is cancelled while running command, propagate
-                    raise
-                except Exception as e:
-                    results["errors"].append(f"Run execution failed: {str(e)}")
-        except asyncio.CancelledError:
-            # Propagate cancellation
+    @staticmethod
+    async def parse_and_execute_stream(chunks) -> tuple:
+        """Execute directives from a streamed response as soon as each one is complete.
+
+        Directives run in a separate task, so file writes overlap with the
+        rest of the generation. Returns (full response text, results).
+        """
+        results = ResponseParser._new_async_results()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def _consume() -> None:
+            while True:
+                matches = await queue.get()
+                if matches is None:
+                    return
+                await ResponseParser._execute_matches(results, matches)
+
+        consumer = asyncio.create_task(_consume())
+        scanner = _DirectiveScanner()
+        # Kept in a local so += can extend the string in place
+        text = ""
+        try:
+            async for chunk in chunks:
+                text += chunk
+                ready = scanner.scan(text)
+                if ready:
+                    queue.put_nowait(ready)
+            queue.put_nowait(list(_DIRECTIVE_RE.finditer(text, scanner.pos)))
+            queue.put_nowait(None)
+            await consumer
+        except BaseException:
+            consumer.cancel()
             raise
-        except Exception as e:
-            results["errors"].append(f"Async parser error: {str(e)}")
-        
-        return results
+        return text, results
 
 
 class AIClient:
     """Handles communication with the AI API (both remote and local Ollama)"""
     
-    def __init__(self, model: str, key_manager: Optional[KeyStore] = None):
-        self.api_key = API_KEY
+    # Shared HTTP clients ("remote" / "ollama"), created on first use and
+    # reused so connections stay pooled across requests
+    _clients: Dict[str, httpx.AsyncClient] = {}
+    
+    @classmethod
+    def _get_client(cls, kind: str = "remote") -> httpx.AsyncClient:
+        client = cls._clients.get(kind)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=40,
+                    keepalive_expiry=30.0,
+                ),
+            )
+            cls._clients[kind] = client
+        return client
+    
+    @classmethod
+    async def aclose_clients(cls) -> None:
+        """Close the shared HTTP clients, including the sync Ollama probe client (call once on shutdown)"""
+        global _ollama_sync_client
+        clients = list(cls._clients.values())
+        cls._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+        sync_client, _ollama_sync_client = _ollama_sync_client, None
+        if sync_client is not None:
+            try:
+                sync_client.close()
+            except Exception:
+                pass
+    
+    def __init__(self, model: str, key_manager: Optional[KeyStore] = None, state: Optional[AppState] = None):
+        # The fallback API key lives on the shared state so menu updates reach every client
+        self.state = state if state is not None else AppState(api_key=API_KEY, model=model, key_store=key_manager)
         self.model = model
         self.endpoint = API_ENDPOINT
         self.is_ollama = model.startswith("ollama/")
         self.key_manager = key_manager
+        # Headers that are the same for every remote request; only Authorization varies
+        self._base_headers = {
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://custom-cli-tool.local",
+            "X-Title": "Custom CLI Tool"
+        }
         
         if self.is_ollama:
             # Extract actual model name for Ollama
             self.ollama_model = model.replace("ollama/", "")
             self.ollama_endpoint = "http://localhost:11434/api/chat"
     
+    @property
+    def api_key(self) -> Optional[str]:
+        return self.state.api_key
+    
     async def send_message(self, messages: List[Dict], temperature: float = 0.7) -> str:
         """Send a message to the AI and get a response"""
         
@@ -553,14 +1088,14 @@ class AIClient:
                 }
             }
             
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    self.ollama_endpoint,
-                    json=payload
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data["message"]["content"]
+            client = AIClient._get_client("ollama")
+            response = await client.post(
+                self.ollama_endpoint,
+                json=payload
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data["message"]["content"]
         except httpx.HTTPError as e:
             console.print(f"[red]Ollama API Error: {e}[/red]")
             console.print("[yellow]Make sure Ollama is running: ollama serve[/yellow]")
@@ -569,8 +1104,77 @@ class AIClient:
             console.print(f"[red]Ollama connection error: {e}[/red]")
             return ""
     
-    async def _send_remote_message(self, messages: List[Dict], temperature: float = 0.7) -> str:
-        """Send message to remote API (OpenRouter) - requires user's own API key"""
+    async def stream_message(self, messages: List[Dict], temperature: float = 0.7):
+        """Yield the AI response in text chunks as they arrive"""
+        stream = self._stream_ollama_message if self.is_ollama else self._stream_remote_message
+        async for chunk in stream(messages, temperature):
+            yield chunk
+    
+    async def _stream_ollama_message(self, messages: List[Dict], temperature: float = 0.7):
+        """Stream a reply from local Ollama (newline-delimited JSON)"""
+        payload = {
+            "model": self.ollama_model,
+            "messages": messages,
+            "stream": True,
+            "options": {
+                "temperature": temperature
+            }
+        }
+        try:
+            client = AIClient._get_client("ollama")
+            async with client.stream("POST", self.ollama_endpoint, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = _json_loads(line)
+                    chunk = (data.get("message") or {}).get("content")
+                    if chunk:
+                        yield chunk
+                    if data.get("done"):
+                        break
+        except httpx.HTTPError as e:
+            console.print(f"[red]Ollama API Error: {e}[/red]")
+            console.print("[yellow]Make sure Ollama is running: ollama serve[/yellow]")
+        except Exception as e:
+            console.print(f"[red]Ollama connection error: {e}[/red]")
+    
+    async def _stream_remote_message(self, messages: List[Dict], temperature: float = 0.7):
+        """Stream a reply from the remote API (server-sent events)"""
+        user_key = self._resolve_user_key()
+        if not user_key:
+            return
+        headers = {**self._base_headers, "Authorization": f"Bearer {user_key}"}
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+        }
+        try:
+            client = AIClient._get_client("remote")
+            async with client.stream("POST", self.endpoint, headers=headers, content=_json_body(payload)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    # Skip blank keep-alives and ": comment" lines
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = _json_loads(data)["choices"][0].get("delta", {}).get("content")
+                    except (ValueError, KeyError, IndexError):
+                        continue
+                    if chunk:
+                        yield chunk
+        except httpx.HTTPError as e:
+            console.print(f"[red]API Hatası: {e}[/red]")
+        except Exception as e:
+            console.print(f"[red]Beklenmeyen hata: {e}[/red]")
+    
+    def _resolve_user_key(self) -> Optional[str]:
+        """API key for remote requests; prints setup hints and returns None if there is none"""
         # Prefer the user's saved key, but gracefully fall back to .env AI_API_KEY if available
         user_key = None
         try:
@@ -601,14 +1205,16 @@ class AIClient:
             console.print("[yellow]Çözüm: \\ menüsünden 'Kendi OpenRouter API Anahtarını Gir' seçeneğini kullanın veya .env dosyasına AI_API_KEY ekleyin.[/yellow]")
             if ks_state is not None:
                 console.print(f"[dim]Tanılama - use_user_key: {ks_state['use_user_key']}, has_user_key: {ks_state['has_user_key']}[/dim]")
+            return None
+        return user_key
+    
+    async def _send_remote_message(self, messages: List[Dict], temperature: float = 0.7) -> str:
+        """Send message to remote API (OpenRouter) - requires user's own API key"""
+        user_key = self._resolve_user_key()
+        if not user_key:
             return ""
         
-        headers = {
-            "Authorization": f"Bearer {user_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://custom-cli-tool.local",
-            "X-Title": "Custom CLI Tool"
-        }
+        headers = {**self._base_headers, "Authorization": f"Bearer {user_key}"}
         
         payload = {
             "model": self.model,
@@ -617,15 +1223,15 @@ class AIClient:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    self.endpoint,
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+            client = AIClient._get_client("remote")
+            response = await client.post(
+                self.endpoint,
+                headers=headers,
+                content=_json_body(payload)
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data["choices"][0]["message"]["content"]
         except httpx.HTTPError as e:
             console.print(f"[red]API Hatası: {e}[/red]")
             return ""
@@ -634,6 +1240,20 @@ class AIClient:
             return ""
 
 
+def _fenced_body(text: str) -> str:
+    """Return the body of the first ```json (or bare ```) fence, or text unchanged"""
+    start = text.find("```json")
+    if start >= 0:
+        start += 7
+    else:
+        start = text.find("```")
+        if start < 0:
+            return text
+        start += 3
+    end = text.find("```", start)
+    return (text[start:end] if end >= 0 else text[start:]).strip()
+
+
 class TaskPlanner:
     """Analyzes tasks and breaks them down into steps"""
     
@@ -642,7 +1262,6 @@ class TaskPlanner:
     
     async def analyze_task(self, user_input: str) -> Dict:
         """Determine if task needs step-by-step breakdown or simple response"""
-        
         analysis_prompt = f"""Analyze this input and categorize it:
 
 CATEGORY 1 - Normal Conversation/Question (respond with "conversation"):
@@ -694,18 +1313,13 @@ Respond in JSON format:
             response = await self.ai_client.send_message(messages, temperature=0.3)
         
         try:
-            response = response.strip()
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0].strip()
+            response = _fenced_body(response.strip())
             
-            ret = json.loads(response)
+            ret = _json_loads(response)
             # V6 dynamic adaptation: ensure robust step count and concurrency hints
             if isinstance(ret, dict) and (ret.get("mode") == "project"):
                 try:
-                    from thinking_python import estimate_task_complexity, break_down_task
-                    comp = estimate_task_complexity(user_input)
+                    comp = _estimate_complexity(user_input)
                     level = comp.get("level", "medium")
                     mapped = "small" if level == "low" else ("large" if level == "high" else "medium")
                     base_steps = comp.get("estimated_steps", 7)
@@ -740,28 +1354,99 @@ Respond in JSON format:
             }
 
 
+# Sub-steps without one of these verbs get an "Implement:" prefix
+_ACTION_VERBS = ("create", "build", "implement", "update", "generate", "write")
+# Most recent entries kept per StepExecutor memory list; older ones are dropped
+_MEMORY_LIMITS = {
+    "decisions": 200,
+    "summaries": 500,
+    "files_created": 1000,
+    "folders_created": 500,
+}
+# Seconds the background saver waits to batch sub-step progress into one write
+_SAVE_DEBOUNCE = 0.5
+_PROJECT_ID_SANITIZE_RE = re.compile(r"[^A-Za-z0-9_-]+")
+_PROJECT_ID_VALID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+# Errors a retry cannot fix; a sub-step whose errors are all of these is not retried
+_NO_RETRY_MARKERS = ("cancelled", "permission denied")
+
+
+# System prompt shared by every sub-step request and its retry
+_SUBSTEP_SYSTEM_PROMPT = """You are Oroto AI, executing a multi-step task with sub-steps. You are a CODING assistant - create actual code files immediately.
+
+CRITICAL RULES:
+1. DO NOT just describe or plan - CREATE FILES WITH CODE at EVERY sub-step
+2. Each sub-step MUST create at least one file with actual working code
+3. Use the file creation commands - they will execute automatically
+
+COMMANDS TO CREATE FILES:
+
+1. CREATE A SINGLE FILE WITH CODE:
+CREATE_FILE: path/to/filename.ext
+```language
+actual working code here
+```
+
+2. CREATE PROJECT WITH MULTIPLE FILES:
+CREATE_PROJECT: project_name
+```json
+{
+  "folder1": {
+    "file1.html": "<!DOCTYPE html>...complete code...",
+    "file2.css": "complete css code..."
+  }
+}
+```
+
+3. CREATE FOLDER:
+CREATE_FOLDER: path/to/folder
+
+4. RUN TESTS/COMMANDS (safe & interruptible):
+RUN: npm test
+RUN_TEST: pytest -q
+
+EXECUTION RULES:
+1. START CODING IMMEDIATELY - don't just plan
+2. Each sub-step = create actual files with real code
+3. For web/mobile apps: Create HTML, CSS, JS files with complete code
+4. Write FULL, WORKING code in each file - not placeholders
+5. Build feature by feature, file by file
+6. Keep descriptions brief - focus on creating files
+"""
+
+
 class StepExecutor:
     """Executes tasks step by step with pause and re-evaluation"""
     
+    _SUBSTEP_SYSTEM_MSG = {"role": "system", "content": _SUBSTEP_SYSTEM_PROMPT}
+    
     def __init__(self, ai_client: AIClient, project_state: ProjectState):
         self.ai_client = ai_client
         self.project_state = project_state
         self.conversation_history = []
         self.current_project_name = None
         # Simple memory store to improve reasoning across steps
-        self.memory = {
-            "decisions": [],
-            "summaries": [],
-            "files_created": [],
-            "folders_created": []
-        }
-        # Concurrency control for sub-steps
-        self._substep_sem = asyncio.Semaphore(2)
+        self.memory = {key: deque(maxlen=limit) for key, limit in _MEMORY_LIMITS.items()}
+        # Files recorded so far; the bounded deque's length stops growing once it is full
+        self._files_recorded = 0
+        # Sub-steps run at most this many at a time
         self.max_concurrency = 2
         # Stop control
         self._stop_requested = False
         self._current_substep_tasks = []
         self.current_project_id = None
+        # Latest sub-step snapshot waiting for the background saver
+        self._pending_save: Optional[tuple] = None
+        self._save_dirty = asyncio.Event()
+        # last_updated stamp, re-formatted at most once a second
+        self._last_ts_mono = float("-inf")
+        self._last_ts_iso = ""
+        # Project state dict of the running task, shared with its sub-steps
+        self._project_data: Optional[Dict] = None
+        # One live spinner display shared by all sub-steps of a running task
+        self._progress = None
 
     def request_stop(self):
         """Request to stop execution and cancel any active sub-step tasks."""
@@ -773,10 +1458,98 @@ class StepExecutor:
             except Exception:
                 pass
 
+    def _remember_created(self, parse_results: Dict):
+        """Record files and folders a parsed response created"""
+        files = parse_results.get("files_created")
+        if files:
+            self.memory["files_created"].extend(files)
+            self._files_recorded += len(files)
+        if parse_results.get("folders_created"):
+            self.memory["folders_created"].extend(parse_results["folders_created"])
+
+    def _now_iso(self) -> str:
+        m = time.monotonic()
+        if m - self._last_ts_mono >= 1.0:
+            self._last_ts_iso = datetime.now().isoformat()
+            self._last_ts_mono = m
+        return self._last_ts_iso
+
+    def _mark_dirty(self, project_id: str, data: Dict):
+        """Queue a project snapshot; the saver writes only the latest one"""
+        self._pending_save = (project_id, data)
+        self._save_dirty.set()
+
+    def _drop_pending_save(self):
+        """Forget a queued snapshot that a newer save is about to supersede"""
+        self._pending_save = None
+        self._save_dirty.clear()
+
+    async def _saver_loop(self):
+        """Coalesce sub-step saves into at most one write per _SAVE_DEBOUNCE seconds"""
+        while True:
+            await self._save_dirty.wait()
+            await asyncio.sleep(_SAVE_DEBOUNCE)
+            pending = self._pending_save
+            self._drop_pending_save()
+            if pending:
+                await self.project_state.save_project_async(*pending)
+
+    @staticmethod
+    def _should_retry(errors: List[str]) -> bool:
+        return any(not any(m in e.lower() for m in _NO_RETRY_MARKERS) for e in errors)
+
+    async def _run_pool(self, coros, k: int) -> None:
+        """Run coroutines with at most k in flight, starting the next as each one finishes.
+
+        coros is consumed lazily, so sub-steps not yet started are never created
+        if one fails or the run is stopped.
+        """
+        it = iter(coros)
+        pending = {asyncio.create_task(c) for c in islice(it, k)}
+        try:
+            while pending:
+                self._current_substep_tasks = list(pending)
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    # Re-raise sub-step errors and cancellation, as gather would
+                    t.result()
+                pending.update(asyncio.create_task(c) for c in islice(it, len(done)))
+        except BaseException:
+            for t in pending:
+                t.cancel()
+            if pending:
+                # Let cancelled sub-steps persist their partial state before propagating
+                await asyncio.wait(pending)
+            raise
+
+    @contextmanager
+    def _spinner(self, label: str):
+        """Show a spinner row on the shared display, or a standalone one outside a task run"""
+        progress = self._progress
+        if progress is not None:
+            # Live only while some sub-step is waiting on the AI, so the
+            # display never redraws over the REPL prompt between them
+            if not progress.task_ids:
+                progress.start()
+            tid = progress.add_task(label, total=None)
+            try:
+                yield
+            finally:
+                progress.remove_task(tid)
+                if not progress.task_ids:
+                    progress.stop()
+            return
+        with Progress(
+            SpinnerColumn(spinner_name="dots", style="#C8A882"),
+            TextColumn(f"[#C8A882]{label}[/#C8A882]"),
+            console=console
+        ) as progress:
+            progress.add_task(description="", total=None)
+            yield
+
     async def _generate_substeps(self, step_desc: str) -> List[str]:
         """Generate actionable sub-steps for a given main step."""
-        from thinking_python import break_down_task, estimate_task_complexity
-        complexity = estimate_task_complexity(step_desc)
+        complexity = _estimate_complexity(step_desc)
         # Aim 3-8 sub-steps depending on complexity
         num = max(3, min(8, complexity.get("estimated_steps", 5) + (2 if complexity.get("level") == "high" else 1)))
         substeps = break_down_task(step_desc, num_steps=num)
@@ -787,173 +1560,104 @@ class StepExecutor:
             if not s_clean:
                 s_clean = f"Alt görev {idx}"
             # Prefix to nudge code/file creation
-            if not re.search(r"create|build|implement|update|generate|write", s_clean, re.IGNORECASE):
+            s_lower = s_clean.lower()
+            if not any(v in s_lower for v in _ACTION_VERBS):
                 s_clean = f"Implement: {s_clean}"
             normalized.append(s_clean)
         return normalized
 
     async def _run_substep(self, i: int, j: int, sub: str, context: str, results: List[str], permission_granted: bool,
                            substeps_map: Dict[str, List[str]], project_id: str, task_name: str, original_input: str,
-                           saved_state: Optional[Dict], steps: List[str]):
-        """Execute a single sub-step in a concurrency-controlled block and persist progress immediately."""
-        from thinking_python import prevent_hallucination_in_long_tasks, classify_defects
-        async with self._substep_sem:
-            try:
-                console.print(f"\n[#C8A882]→ Executing sub-step {i}.{j}/{i}.{len(substeps_map.get(str(i), []))}: {sub}[/#C8A882]")
+                           saved_state: Optional[Dict], steps: List[str], trimmed_context: Optional[str] = None):
+        """Execute a single sub-step and queue its progress for saving."""
+        from rich.markdown import Markdown
+        try:
+            console.print(f"\n[#C8A882]→ Executing sub-step {i}.{j}/{i}.{len(substeps_map.get(str(i), []))}: {sub}[/#C8A882]")
+            if trimmed_context is None:
                 trimmed_context = prevent_hallucination_in_long_tasks(context)
-                # Build sub-step prompt with recent results
-                step_context = f"{trimmed_context}\n\nPrevious steps completed:\n"
-                for pj, prev_result in enumerate(results, 1):
-                    step_context += f"\nStep {pj} Result:\n{prev_result}\n"
-                sub_prompt = (
-                    f"\nNow execute Sub-step {i}.{j} (of Step {i}): {sub}\n"
-                    f"Focus on a small, atomic change and CREATE WORKING CODE FILES."
+            # Build sub-step prompt with recent results
+            parts = [trimmed_context, "\n\nPrevious steps completed:\n"]
+            parts.extend(f"\nStep {pj} Result:\n{prev_result}\n" for pj, prev_result in enumerate(results, 1))
+            step_context = "".join(parts)
+            sub_prompt = (
+                f"\nNow execute Sub-step {i}.{j} (of Step {i}): {sub}\n"
+                f"Focus on a small, atomic change and CREATE WORKING CODE FILES."
+            )
+            messages = [
+                self._SUBSTEP_SYSTEM_MSG,
+                {"role": "user", "content": step_context + "\n\n" + sub_prompt}
+            ]
+            # Deterministic, error-minimizing generation
+            with self._spinner(f"Step {i}.{j} thinking..."):
+                # Directives run while the rest of the reply is still streaming in
+                response, parse_results = await ResponseParser.parse_and_execute_stream(
+                    self.ai_client.stream_message(messages, temperature=0.2)
                 )
-                system_prompt = """You are Oroto AI, executing a multi-step task with sub-steps. You are a CODING assistant - create actual code files immediately.
-
-CRITICAL RULES:
-1. DO NOT just describe or plan - CREATE FILES WITH CODE at EVERY sub-step
-2. Each sub-step MUST create at least one file with actual working code
-3. Use the file creation commands - they will execute automatically
-
-COMMANDS TO CREATE FILES:
-
-1. CREATE A SINGLE FILE WITH CODE:
-CREATE_FILE: path/to/filename.ext
-```language
-actual working code here
-```
-
-2. CREATE PROJECT WITH MULTIPLE FILES:
-CREATE_PROJECT: project_name
-```json
-{
-  "folder1": {
-    "file1.html": "<!DOCTYPE html>...complete code...",
-    "file2.css": "complete css code..."
-  }
-}
-```
-
-3. CREATE FOLDER:
-CREATE_FOLDER: path/to/folder
-
-4. RUN TESTS/COMMANDS (safe & interruptible):
-RUN: npm test
-RUN_TEST: pytest -q
-
-EXECUTION RULES:
-1. START CODING IMMEDIATELY - don't just plan
-2. Each sub-step = create actual files with real code
-3. For web/mobile apps: Create HTML, CSS, JS files with complete code
-4. Write FULL, WORKING code in each file - not placeholders
-5. Build feature by feature, file by file
-6. Keep descriptions brief - focus on creating files
-"""
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": step_context + "\n\n" + sub_prompt}
-                ]
-                # Deterministic, error-minimizing generation
-                with Progress(
-                    SpinnerColumn(spinner_name="dots", style="#C8A882"),
-                    TextColumn("[#C8A882]Thinking...[/#C8A882]"),
-                    console=console
-                ) as progress:
-                    progress.add_task(description="", total=None)
-                    response = await self.ai_client.send_message(messages, temperature=0.2)
-                if not response:
-                    console.print(f"[red]No response for sub-step {i}.{j}. Skipping.[/red]")
-                else:
-                    console.print(Panel(Markdown(response), title=f"[bold #C8A882]AI - Step {i}.{j}[/bold #C8A882]", border_style="#C8A882"))
-                    results.append(response)
-                    parse_results = await ResponseParser.parse_and_execute_async(response)
-                    # Show diffs for verification
-                    if parse_results.get("diffs"):
-                        for d in parse_results["diffs"]:
-                            console.print(Panel(Markdown(f"```diff\n{d['diff']}\n```"), title=f"[bold magenta]Diff[/bold magenta]: {d['file']}", border_style="magenta"))
-                    # Memory updates
-                    if parse_results.get("files_created"):
-                        self.memory["files_created"].extend(parse_results["files_created"])
-                    if parse_results.get("folders_created"):
-                        self.memory["folders_created"].extend(parse_results["folders_created"])
-                    if parse_results.get("errors"):
+            if not response:
+                console.print(f"[red]No response for sub-step {i}.{j}. Skipping.[/red]")
+            else:
+                console.print(Panel(Markdown(response), title=f"[bold #C8A882]AI - Step {i}.{j}[/bold #C8A882]", border_style="#C8A882"))
+                results.append(response)
+                # Show diffs for verification
+                if parse_results.get("diffs"):
+                    # One print for all diff panels rather than a render per file
+                    console.print(Group(*(
+                        Panel(Markdown(f"```diff\n{d['diff']}\n```"), title=f"[bold magenta]Diff[/bold magenta]: {d['file']}", border_style="magenta")
+                        for d in parse_results["diffs"]
+                    )))
+                # Memory updates
+                self._remember_created(parse_results)
+                if parse_results.get("errors"):
+                    if LOG_LEVEL == "debug":
                         classification = classify_defects(parse_results["errors"])
                         console.print(f"[dim]Defect classification: {classification['summary']}[/dim]")
+                    if self._should_retry(parse_results["errors"]):
                         # One retry attempt
                         fix_prompt = (
                             f"Errors occurred during Sub-step {i}.{j}. Please fix the issues and re-create files if needed.\n"
                             f"Errors: {parse_results['errors']}"
                         )
                         retry_messages = [
-                            {"role": "system", "content": system_prompt},
+                            self._SUBSTEP_SYSTEM_MSG,
                             {"role": "user", "content": step_context + "\n\n" + sub_prompt + "\n\n" + fix_prompt}
                         ]
-                        with Progress(
-                            SpinnerColumn(spinner_name="dots", style="#C8A882"),
-                            TextColumn("[#C8A882]Retrying...[/#C8A882]"),
-                            console=console
-                        ) as progress:
-                            progress.add_task(description="", total=None)
+                        with self._spinner(f"Step {i}.{j} retrying..."):
                             retry_resp = await self.ai_client.send_message(retry_messages, temperature=0.2)
                         if retry_resp:
                             console.print(Panel(Markdown(retry_resp), title=f"[bold #C8A882]AI - Step {i}.{j} Retry[/bold #C8A882]", border_style="#C8A882"))
                             retry_parse = await ResponseParser.parse_and_execute_async(retry_resp)
                             if retry_parse.get("operations", 0) > 0:
                                 console.print(f"[green]✓ Retry executed {retry_parse['operations']} additional operation(s)[/green]")
-                            if retry_parse.get("files_created"):
-                                self.memory["files_created"].extend(retry_parse["files_created"])
-                            if retry_parse.get("folders_created"):
-                                self.memory["folders_created"].extend(retry_parse["folders_created"])
-                # Mark sub-step complete immediately
-                current_substep = j
-                # Append a short summary to memory
-                summary_line = f"Step {i}.{j} → ops:{parse_results.get('operations',0)} files:{len(parse_results.get('files_created',[]))} folders:{len(parse_results.get('folders_created',[]))} commands:{len(parse_results.get('commands_run',[]))}"
-                self.memory["summaries"].append(summary_line)
-                # Persist progress including memory
-                project_data = {
-                    "project_id": project_id,
-                    "task_name": task_name,
-                    "original_input": original_input,
-                    "steps": steps,
-                    "current_step": i - 1,
-                    "current_substep": current_substep,
-                    "results": results,
-                    "context": context,
-                    "permission_granted": permission_granted,
-                    "substeps_map": substeps_map,
-                    "status": "in_progress",
-                    "created_at": saved_state.get("created_at", datetime.now().isoformat()) if saved_state else datetime.now().isoformat(),
-                    "last_updated": datetime.now().isoformat(),
-                    "memory": self.memory
-                }
-                self.project_state.save_project(project_id, project_data)
-
-            except asyncio.CancelledError:
-                # Persist partial project state on cancellation
-                partial_data = {
-                    "project_id": project_id,
-                    "task_name": task_name,
-                    "original_input": original_input,
-                    "steps": steps,
-                    "current_step": i - 1,
-                    "current_substep": max(0, j - 1),
-                    "results": results,
-                    "context": context,
-                    "permission_granted": permission_granted,
-                    "substeps_map": substeps_map,
-                    "status": "stopped",
-                    "created_at": saved_state.get("created_at", datetime.now().isoformat()) if saved_state else datetime.now().isoformat(),
-                    "last_updated": datetime.now().isoformat(),
-                    "memory": self.memory
-                }
-                self.project_state.save_project(project_id, partial_data)
-                console.print("[bold yellow]Sub-step cancelled by user. Partial progress saved.[/bold yellow]")
-                raise
+                            self._remember_created(retry_parse)
+            # Mark sub-step complete immediately
+            current_substep = j
+            # Append a short summary to memory
+            summary_line = f"Step {i}.{j} → ops:{parse_results.get('operations',0)} files:{len(parse_results.get('files_created',[]))} folders:{len(parse_results.get('folders_created',[]))} commands:{len(parse_results.get('commands_run',[]))}"
+            self.memory["summaries"].append(summary_line)
+            # Persist progress including memory
+            # Only the progress fields change; the rest of the shared dict is already current
+            project_data = self._project_data
+            project_data["current_step"] = i - 1
+            project_data["current_substep"] = current_substep
+            project_data["status"] = "in_progress"
+            project_data["last_updated"] = self._now_iso()
+            self._mark_dirty(project_id, project_data)
+
+        except asyncio.CancelledError:
+            # Persist partial project state on cancellation
+            partial_data = self._project_data
+            partial_data["current_step"] = i - 1
+            partial_data["current_substep"] = max(0, j - 1)
+            partial_data["status"] = "stopped"
+            partial_data["last_updated"] = self._now_iso()
+            self._drop_pending_save()
+            self.project_state.save_project(project_id, partial_data)
+            console.print("[bold yellow]Sub-step cancelled by user. Partial progress saved.[/bold yellow]")
+            raise
 
     async def execute_simple_task(self, user_input: str):
         """Quick single-response execution for conversation mode."""
-        from thinking_python import sanitize_input, prevent_hallucination_in_long_tasks
+        from rich.markdown import Markdown
         clean_input = sanitize_input(user_input)
         messages = [
             {"role": "system", "content": "You are Oroto AI, a helpful assistant. Provide concise, accurate answers. If user requests code, include full working code between triple backticks. Avoid destructive commands."},
@@ -974,11 +1678,12 @@ EXECUTION RULES:
 
     async def execute_complex_task(self, task_name: str, steps: List[str], original_input: str, project_id: Optional[str] = None, complexity_hint: Optional[Dict] = None):
         """Execute a complex project with sub-steps, concurrency, and persistent memory."""
-        from thinking_python import prevent_hallucination_in_long_tasks, create_version_snapshot, sanitize_input
         # Prepare or resume project state
         self.current_project_name = task_name
         clean_input = sanitize_input(original_input)
         context = f"Project: {task_name}\nOriginal Request:\n{clean_input}\n\nPlanned Steps ({len(steps)}):\n" + "\n".join([f"{idx+1}. {s}" for idx, s in enumerate(steps)])
+        # context is fixed for the whole project, so trim it once rather than per sub-step
+        trimmed_context = prevent_hallucination_in_long_tasks(context)
 
         permission_granted = False
         results: List[str] = []
@@ -998,14 +1703,16 @@ EXECUTION RULES:
                 # Restore memory if present
                 mem = saved_state.get("memory")
                 if isinstance(mem, dict):
-                    self.memory.update(mem)
+                    for key, value in mem.items():
+                        limit = _MEMORY_LIMITS.get(key)
+                        self.memory[key] = deque(value, maxlen=limit) if limit and isinstance(value, list) else value
 
         if not project_id:
             # Generate a safe project_id
-            base = re.sub(r"[^A-Za-z0-9_-]+", "-", task_name.strip())[:40].strip("-")
+            base = _PROJECT_ID_SANITIZE_RE.sub("-", task_name.strip())[:40].strip("-")
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             project_id = base.lower() if base else f"proj-{timestamp}"
-            project_id = project_id if re.match(r"^[A-Za-z0-9_-]+$", project_id) else f"proj-{timestamp}"
+            project_id = project_id if _PROJECT_ID_VALID_RE.match(project_id) else f"proj-{timestamp}"
 
         # Ask permission once if not previously granted
         if not permission_granted:
@@ -1021,7 +1728,7 @@ EXECUTION RULES:
             workspace_dir.mkdir(parents=True, exist_ok=True)
             (workspace_dir / ".logs").mkdir(parents=True, exist_ok=True)
             os.chdir(str(workspace_dir))
-            console.print(f"[dim]Workspace: {workspace_dir}[/dim]")
+            _print_status(f"Workspace: {workspace_dir}", "dim")
         except Exception as e:
             console.print(f"[yellow]Workspace setup warning: {e}[/yellow]")
 
@@ -1043,7 +1750,9 @@ EXECUTION RULES:
             "memory": self.memory,
             "workspace": str(workspace_dir)
         }
-        self.project_state.save_project(project_id, project_data)
+        # Sub-steps update this same dict in place rather than rebuilding it per save
+        self._project_data = project_data
+        await self.project_state.save_project_async(project_id, project_data)
         self.current_project_id = project_id
 
         # Apply dynamic concurrency based on V6 complexity hints
@@ -1053,85 +1762,106 @@ EXECUTION RULES:
                 k = int(complexity_hint.get("suggested_concurrency", k))
             k = max(1, min(8, k))
             if k != self.max_concurrency:
+                # Read by _run_pool at each step, so nothing needs rebuilding
                 self.max_concurrency = k
-                self._substep_sem = asyncio.Semaphore(k)
-                console.print(f"[dim]Parallel substep concurrency set to {k}[/dim]")
+                _print_status(f"Parallel substep concurrency set to {k}", "dim")
         except Exception:
             pass
 
         # Execute each remaining step
         total_steps = len(steps)
+        saver = asyncio.create_task(self._saver_loop())
+        self._progress = Progress(
+            SpinnerColumn(spinner_name="dots", style="#C8A882"),
+            TextColumn("[#C8A882]{task.description}[/#C8A882]"),
+            console=console
+        )
         try:
+            # Plans depend only on the step text, so make every missing one up
+            # front and persist them with a single save
+            missing = [n for n in range(current_step_completed + 1, total_steps + 1) if str(n) not in substeps_map]
+            if missing:
+                for n in missing:
+                    substeps_map[str(n)] = await self._generate_substeps(steps[n - 1])
+                # Persist substeps plan
+                project_data["substeps_map"] = substeps_map
+                project_data["last_updated"] = self._now_iso()
+                await self.project_state.save_project_async(project_id, project_data)
+
             for i in range(current_step_completed + 1, total_steps + 1):
                 step_desc = steps[i - 1]
                 console.print(Panel.fit(f"[bold]Step {i}/{total_steps}[/bold]\n{step_desc}", border_style="#C8A882", title="[bold #C8A882]Executing Step[/bold #C8A882]"))
-            # Generate substeps if not already present
-            if str(i) not in substeps_map:
-                substeps_map[str(i)] = await self._generate_substeps(step_desc)
-                # Persist substeps plan
-                project_data["substeps_map"] = substeps_map
-                project_data["last_updated"] = datetime.now().isoformat()
-                self.project_state.save_project(project_id, project_data)
-
-            substeps = substeps_map.get(str(i), [])
-            if not substeps:
-                console.print("[yellow]No sub-steps generated; executing step directly.[/yellow]")
-
-            # Execute sub-steps in parallel with concurrency control
-            current_substep = 0
-            before_file_count = len(self.memory.get("files_created", []))
-            tasks = []
-            for j, sub in enumerate(substeps, 1):
-                t = asyncio.create_task(self._run_substep(i, j, sub, context, results, permission_granted, substeps_map, project_id, task_name, original_input, saved_state, steps))
-                tasks.append(t)
-            self._current_substep_tasks = tasks
-            if tasks:
-                await asyncio.gather(*tasks)
-                current_substep = len(substeps)
-            self._current_substep_tasks = []
-            after_file_count = len(self.memory.get("files_created", []))
-            new_files_this_step = self.memory.get("files_created", [])[before_file_count:after_file_count]
-
-            # Create snapshot after step completion
-            try:
-                snap = create_version_snapshot(project_id, i, new_files_this_step)
-                if snap.get("success"):
-                    console.print(f"[green]✓ Snapshot saved: {snap.get('snapshot_id')}[/green]")
+                substeps = substeps_map.get(str(i), [])
+                if not substeps:
+                    console.print("[yellow]No sub-steps generated; executing step directly.[/yellow]")
+
+                # Execute sub-steps in parallel with concurrency control
+                current_substep = 0
+                before_file_count = self._files_recorded
+                if self.max_concurrency <= 1:
+                    # One at a time: await directly instead of scheduling a Task per sub-step.
+                    # request_stop cancels this task, which cancels the awaited sub-step.
+                    self._current_substep_tasks = [asyncio.current_task()]
+                    for j, sub in enumerate(substeps, 1):
+                        await self._run_substep(i, j, sub, context, results, permission_granted, substeps_map, project_id, task_name, original_input, saved_state, steps, trimmed_context)
+                    current_substep = len(substeps)
                 else:
-                    console.print(f"[yellow]Snapshot warning: {snap.get('message')}[/yellow]")
-            except Exception as e:
-                console.print(f"[yellow]Snapshot failed: {e}[/yellow]")
-
-            # Update memory with step summary/decision
-            decision_summary = f"Completed Step {i}: {step_desc} → files:{len(new_files_this_step)}"
-            self.memory["decisions"].append(decision_summary)
-
-            # Persist progress after step completion
-            project_data.update({
-                "current_step": i,
-                "current_substep": current_substep,
-                "results": results,
-                "permission_granted": permission_granted,
-                "substeps_map": substeps_map,
-                "last_updated": datetime.now().isoformat(),
-                "memory": self.memory
-            })
-            self.project_state.save_project(project_id, project_data)
+                    await self._run_pool(
+                        (self._run_substep(i, j, sub, context, results, permission_granted, substeps_map, project_id, task_name, original_input, saved_state, steps, trimmed_context)
+                         for j, sub in enumerate(substeps, 1)),
+                        self.max_concurrency
+                    )
+                    current_substep = len(substeps)
+                self._current_substep_tasks = []
+                files_created = self.memory["files_created"]
+                added = min(self._files_recorded - before_file_count, len(files_created))
+                new_files_this_step = list(islice(files_created, len(files_created) - added, None))
 
-            # Show progress
-            console.print(f"[#C8A882]Progress: {i}/{total_steps} steps completed. Substeps: {current_substep}/{len(substeps)}[/#C8A882]")
+                # Create snapshot after step completion
+                try:
+                    snap = create_version_snapshot(project_id, i, new_files_this_step)
+                    if snap.get("success"):
+                        _print_status(f"✓ Snapshot saved: {snap.get('snapshot_id')}", "green")
+                    else:
+                        console.print(f"[yellow]Snapshot warning: {snap.get('message')}[/yellow]")
+                except Exception as e:
+                    console.print(f"[yellow]Snapshot failed: {e}[/yellow]")
+
+                # Update memory with step summary/decision
+                decision_summary = f"Completed Step {i}: {step_desc} → files:{len(new_files_this_step)}"
+                self.memory["decisions"].append(decision_summary)
+
+                # Persist progress after step completion; this supersedes queued sub-step saves
+                self._drop_pending_save()
+                project_data["current_step"] = i
+                project_data["current_substep"] = current_substep
+                project_data["last_updated"] = self._now_iso()
+                await self.project_state.save_project_async(project_id, project_data)
+
+                # Show progress
+                console.print(f"[#C8A882]Progress: {i}/{total_steps} steps completed. Substeps: {current_substep}/{len(substeps)}[/#C8A882]")
         except asyncio.CancelledError:
             # Save current project state and exit gracefully
             project_data["status"] = "stopped"
-            project_data["last_updated"] = datetime.now().isoformat()
+            project_data["last_updated"] = self._now_iso()
+            self._drop_pending_save()
             self.project_state.save_project(project_id, project_data)
             console.print("[bold yellow]Process stopped by user. Project state saved.[/bold yellow]")
             raise
+        finally:
+            saver.cancel()
+            self._progress.stop()
+            self._progress = None
+            # A failure mid-step must not lose sub-step progress still waiting for the saver
+            if self._pending_save:
+                pending = self._pending_save
+                self._drop_pending_save()
+                self.project_state.save_project(*pending)
 
         # Finalization
         project_data["status"] = "completed"
-        project_data["last_updated"] = datetime.now().isoformat()
-        self.project_state.save_project(project_id, project_data)
+        project_data["last_updated"] = self._now_iso()
+        await self.project_state.save_project_async(project_id, project_data)
 
         # Auto-launch dev server if applicable and show address
         try:
@@ -1140,54 +1870,338 @@ EXECUTION RULES:
             if res.get("success"):
                 addrs = res.get("addresses") or []
                 addr = addrs[0] if addrs else None
-                # Give the process a moment to print its URL
-                await asyncio.sleep(1.5)
-                # Try to refresh addresses from registry
-                procs = await execute_safe_command_async("list_processes")
-                if procs.get("success") and res.get("pid"):
-                    for p in procs.get("processes", []):
-                        if p.get("pid") == res.get("pid"):
-                            addrs = p.get("addresses") or addrs
-                            break
+                # Poll the registry until the process prints its URL, for up to 1.5s
+                pid = res.get("pid")
+                deadline = time.monotonic() + 1.5
+                while pid and not addrs and time.monotonic() < deadline:
+                    await asyncio.sleep(0.1)
+                    procs = await execute_safe_command_async("list_processes")
+                    if procs.get("success"):
+                        for p in procs.get("processes", []):
+                            if p.get("pid") == pid:
+                                addrs = p.get("addresses") or addrs
+                                break
                 addr = addrs[0] if addrs else addr
                 msg = f"Launched dev server (pid {res.get('pid')})."
                 if addr:
                     msg += f" Access: {addr}"
                 console.print(Panel.fit(f"[green]✓ {msg}[/green]", border_style="#C8A882", title="[bold #C8A882]Auto-Run[/bold #C8A882]"))
             else:
-                console.print(f"[dim]Auto-launch skipped: {res.get('error')}[/dim]")
+                _print_status(f"Auto-launch skipped: {res.get('error')}", "dim")
         except Exception as e:
             console.print(f"[yellow]Auto-launch warning: {e}[/yellow]")
 
         console.print(Panel.fit(f"[bold green]Project '{task_name}' completed![/bold green]\nID: {project_id}", border_style="#C8A882", title="[bold #C8A882]Done[/bold #C8A882]"))
 
 
+@dataclass
+class ReplSession:
+    """Objects the REPL command handlers read and replace"""
+    state: AppState
+    key_store: KeyStore
+    models: List[Dict]
+    current_model: str
+    current_model_name: str
+    ai_client: AIClient
+    task_planner: TaskPlanner
+    project_state: ProjectState
+    step_executor: StepExecutor
+    active_project_task: Optional[asyncio.Task] = None
+
+
+async def _cmd_stop(session: ReplSession, arg: str) -> None:
+    # Stop/Abort running project
+    task = session.active_project_task
+    if task and not task.done():
+        # Request stop and cancel the task
+        session.step_executor.request_stop()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        session.active_project_task = None
+        # Also stop any background processes
+        try:
+            res = await stop_all_processes()
+            if res.get("success"):
+                _print_status(f"Stopped {res.get('count', 0)} background processes.", "dim")
+        except Exception:
+            pass
+        console.print("[bold yellow]Process stopped by user. Project state saved.[/bold yellow]")
+    else:
+        _print_status("No running project to stop.", "dim")
+
+
+async def _cmd_model(session: ReplSession, arg: str) -> None:
+    # Open selection menu: list models or enter user API key
+    new_model = select_model(session.state)
+    session.current_model = new_model
+    
+    # Get model name for display
+    for model in session.models:
+        if model["id"] == new_model:
+            session.current_model_name = model["name"]
+            break
+    
+    # Reinitialize AI client with new model (and keep key_store)
+    session.ai_client = AIClient(new_model, session.key_store, session.state)
+    session.task_planner = TaskPlanner(session.ai_client)
+    session.step_executor = StepExecutor(session.ai_client, session.project_state)
+    
+    _print_status(f"✓ Model/anahtar güncellendi! Kullanılan model: {session.current_model_name}", "green")
+
+
+async def _cmd_list(session: ReplSession, arg: str) -> None:
+    projects = await session.project_state.list_projects_async()
+    if not projects:
+        console.print("[#C8A882]No saved projects found.[/#C8A882]")
+        return
+    table = Table(title="Saved Projects", border_style="#C8A882")
+    table.add_column("ID", style="#C8A882")
+    table.add_column("Name", style="green")
+    table.add_column("Status", style="yellow")
+    table.add_column("Progress", style="blue")
+    table.add_column("Substeps", style="magenta")
+    table.add_column("Created", style="dim")
+    
+    # Plain Text cells: column styles still apply, but cell values are not
+    # parsed as markup
+    for proj in projects:
+        table.add_row(
+            Text(proj["id"]),
+            Text(proj["name"]),
+            Text(proj["status"]),
+            Text(f"{proj['current_step']}/{proj['total_steps']}"),
+            Text(proj.get("subprogress", "-")),
+            Text(proj["created"]),
+        )
+    console.print(table)
+
+
+async def _cmd_resume(session: ReplSession, project_id: str) -> None:
+    saved_project = session.project_state.load_project(project_id)
+    if not saved_project:
+        console.print(f"[red]Project '{project_id}' not found.[/red]")
+    elif session.active_project_task and not session.active_project_task.done():
+        console.print("[yellow]A project is already running. Type 'stop' to abort it before resuming another.[/yellow]")
+    else:
+        session.active_project_task = asyncio.create_task(session.step_executor.execute_complex_task(
+            saved_project["task_name"],
+            saved_project["steps"],
+            saved_project["original_input"],
+            project_id=project_id
+        ))
+        _print_status("Resumed project. Type 'stop' to abort.", "dim")
+
+
+async def _cmd_delete(session: ReplSession, project_id: str) -> None:
+    if session.project_state.project_exists(project_id):
+        confirm = Confirm.ask(f"[#C8A882]Delete project '{project_id}'?[/#C8A882]")
+        if confirm:
+            session.project_state.delete_project(project_id)
+            _print_status(f"Project '{project_id}' deleted.", "green")
+    else:
+        console.print(f"[red]Project '{project_id}' not found.[/red]")
+
+
+async def _cmd_ps(session: ReplSession, arg: str) -> None:
+    try:
+        res = await list_processes()
+        if not res.get("success"):
+            console.print(f"[red]Process list error: {res.get('error')}[/red]")
+            return
+        procs = res.get("processes", [])
+        if not procs:
+            _print_status("No active processes.", "dim")
+            return
+        table = Table(title="Active Processes", border_style="#C8A882")
+        table.add_column("PID", style="#C8A882")
+        table.add_column("Command", style="green")
+        table.add_column("CWD", style="blue")
+        table.add_column("Started", style="dim")
+        table.add_column("Status", style="yellow")
+        table.add_column("Addresses", style="magenta")
+        for p in procs:
+            addrs = p.get("addresses") or []
+            table.add_row(
+                Text(str(p.get("pid"))),
+                Text(p.get("command", "-")),
+                Text(p.get("cwd", "-")),
+                Text(p.get("started_at", "-")),
+                Text(p.get("status", "-")),
+                Text(", ".join(addrs) if addrs else "-"),
+            )
+        console.print(table)
+    except Exception as e:
+        console.print(f"[red]ps failed: {e}[/red]")
+
+
+async def _cmd_logs(session: ReplSession, arg: str) -> None:
+    from rich.markdown import Markdown
+    parts = arg.split()
+    pid = parts[0] if parts else None
+    n = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 200
+    if not pid:
+        console.print("[yellow]Usage: logs <pid> [n][/yellow]")
+        return
+    try:
+        res = await tail_logs(str(pid), n=n)
+        if not res.get("success"):
+            console.print(f"[red]Logs error: {res.get('error')}[/red]")
+        else:
+            lines = res.get("lines", [])
+            out = "".join(lines)
+            console.print(Panel(Markdown(f"```\n{out}\n```"), title=f"[bold #C8A882]Logs PID {pid}[/bold #C8A882]", border_style="#C8A882"))
+    except Exception as e:
+        console.print(f"[red]Logs failed: {e}[/red]")
+
+
+async def _cmd_launch(session: ReplSession, proj_id: str) -> None:
+    saved = session.project_state.load_project(proj_id)
+    if not saved:
+        console.print(f"[red]Project '{proj_id}' not found.[/red]")
+        return
+    # Determine workspace
+    ws = saved.get("workspace")
+    if not ws:
+        ws = str((BASE_DIR / "Workspace" / proj_id).resolve())
+    try:
+        res = await launch_auto(cwd=ws)
+        if res.get("success"):
+            addrs = res.get("addresses") or []
+            addr = addrs[0] if addrs else "(address pending)"
+            _print_status(f"✓ Launched '{proj_id}' at {addr} (pid {res.get('pid')})", "green")
+        else:
+            console.print(f"[yellow]Launch failed: {res.get('error')}[/yellow]")
+    except Exception as e:
+        console.print(f"[red]Launch error: {e}[/red]")
+
+
+async def _cmd_kill(session: ReplSession, pid: str) -> None:
+    try:
+        res = await stop_process(str(pid))
+        if res.get("success"):
+            _print_status(f"✓ Process {pid} stopped", "green")
+        else:
+            console.print(f"[yellow]Stop failed: {res.get('error')}[/yellow]")
+    except Exception as e:
+        console.print(f"[red]Stop error: {e}[/red]")
+
+
+async def _cmd_restart(session: ReplSession, pid: str) -> None:
+    try:
+        res = await restart_process(str(pid))
+        if res.get("success"):
+            _print_status(f"✓ Process {pid} restarted (new pid {res.get('pid')})", "green")
+        else:
+            console.print(f"[yellow]Restart failed: {res.get('error')}[/yellow]")
+    except Exception as e:
+        console.print(f"[red]Restart error: {e}[/red]")
+
+
+async def _cmd_stop_all(session: ReplSession, arg: str) -> None:
+    try:
+        res = await stop_all_processes()
+        if res.get("success"):
+            _print_status(f"✓ Stopped {res.get('count', 0)} processes", "green")
+        else:
+            console.print(f"[yellow]Stop-all failed: {res.get('error')}[/yellow]")
+    except Exception as e:
+        console.print(f"[red]Stop-all error: {e}[/red]")
+
+
+async def _cmd_runbg(session: ReplSession, cmd: str) -> None:
+    try:
+        res = await start_process(cmd, cwd=str(Path.cwd()))
+        if res.get("success"):
+            _print_status(f"✓ Started '{cmd}' (pid {res.get('pid')})", "green")
+        else:
+            console.print(f"[yellow]Background start failed: {res.get('error')}[/yellow]")
+    except Exception as e:
+        console.print(f"[red]Background run error: {e}[/red]")
+
+
+# REPL commands: whole-line commands (matched lowercased and stripped), and
+# "<word> <argument>" commands keyed by their lowercased first word
+_EXACT_COMMANDS = {
+    "stop": _cmd_stop,
+    "abort": _cmd_stop,
+    "\\": _cmd_model,
+    "list": _cmd_list,
+    "ps": _cmd_ps,
+    "stop-all": _cmd_stop_all,
+}
+_PREFIX_COMMANDS = {
+    "resume": _cmd_resume,
+    "delete": _cmd_delete,
+    "logs": _cmd_logs,
+    "launch": _cmd_launch,
+    "kill": _cmd_kill,
+    "restart": _cmd_restart,
+    "runbg": _cmd_runbg,
+}
+_QUIT_COMMANDS = frozenset(("quit", "exit", "q"))
+
+
+def _resolve_command(user_input: str):
+    """Return (handler, argument) for a REPL command line, or (None, None)"""
+    # Split once; only the command word is lowercased and the argument keeps its case
+    parts = user_input.split(None, 1)
+    if not parts:
+        return None, None
+    cmd = parts[0].lower()
+    if len(parts) == 1:
+        handler = _EXACT_COMMANDS.get(cmd)
+        return (handler, "") if handler is not None else (None, None)
+    handler = _PREFIX_COMMANDS.get(cmd)
+    if handler is None:
+        return None, None
+    return handler, parts[1].rstrip()
+
+
+# Startup banner markup
+_WELCOME_MARKUP = (
+    "[bold #C8A882]   ___  ____   ___ _____ ___  [/bold #C8A882]\n"
+    "[bold #C8A882]  / _ \\|  _ \\ / _ \\_   _/ _ \\ [/bold #C8A882]\n"
+    "[bold #C8A882] | | | | |_) | | | || || | | |[/bold #C8A882]\n"
+    "[bold #C8A882] | |_| |  _ <| |_| || || |_| |[/bold #C8A882]\n"
+    "[bold #C8A882]  \\___/|_| \\_\\\\___/ |_| \\___/ [/bold #C8A882]\n\n"
+    "[dim]AI Assistant for Projects & Conversations[/dim]\n"
+    "[dim]Commands: list | resume <id> | delete <id> | ps | logs <pid> [n] | launch <id> | kill <pid> | stop-all | runbg <cmd> | quit | \\ (model / anahtar menüsü)[/dim]"
+)
+
+
+@lru_cache(maxsize=1)
+def _welcome_panel():
+    """Welcome banner with its markup parsed once"""
+    return Panel.fit(
+        Text.from_markup(_WELCOME_MARKUP),
+        border_style="#C8A882",
+        title="[bold #C8A882]Welcome[/bold #C8A882]"
+    )
+
+
 async def main():
     """Main CLI entry point"""
+    # Python 3.12+: tasks run synchronously until their first real suspension,
+    # so registry commands that finish without blocking skip a loop round-trip
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
     
     # Show Oroto logo on startup
     console.print()
-    console.print(Panel.fit(
-        "[bold #C8A882]   ___  ____   ___ _____ ___  [/bold #C8A882]\n"
-        "[bold #C8A882]  / _ \\|  _ \\ / _ \\_   _/ _ \\ [/bold #C8A882]\n"
-        "[bold #C8A882] | | | | |_) | | | || || | | |[/bold #C8A882]\n"
-        "[bold #C8A882] | |_| |  _ <| |_| || || |_| |[/bold #C8A882]\n"
-        "[bold #C8A882]  \\___/|_| \\_\\\\___/ |_| \\___/ [/bold #C8A882]\n\n"
-        "[dim]AI Assistant for Projects & Conversations[/dim]\n"
-        "[dim]Commands: list | resume <id> | delete <id> | ps | logs <pid> [n] | launch <id> | kill <pid> | stop-all | runbg <cmd> | quit | \\ (model / anahtar menüsü)[/dim]",
-        border_style="#C8A882",
-        title="[bold #C8A882]Welcome[/bold #C8A882]"
-    ))
+    console.print(_welcome_panel())
     
     # Use saved model if available, otherwise prefer local Ollama
-    models = load_models()
+    catalog = load_models(await get_ollama_models_async())
+    models = catalog.all
     settings = load_user_settings()
     saved_id = settings.get("active_model_id")
     if saved_id and any(m["id"] == saved_id for m in models):
         current_model = saved_id
         current_model_name = next(m["name"] for m in models if m["id"] == saved_id)
     else:
-        local_first = next((m for m in models if m.get("type") == "local"), None)
+        local_first = catalog.local[0] if catalog.local else None
         if local_first:
             current_model = local_first["id"]
             current_model_name = local_first["name"]
@@ -1196,26 +2210,36 @@ async def main():
             current_model_name = models[0]["name"]
     
     # Initialize key store and components with selected model
-    key_store = KeyStore()
-    ai_client = AIClient(current_model, key_store)
-    task_planner = TaskPlanner(ai_client)
+    key_store = get_key_store()
+    state = AppState(api_key=API_KEY, model=current_model, key_store=key_store)
+    ai_client = AIClient(current_model, key_store, state)
     project_state = ProjectState()
-    step_executor = StepExecutor(ai_client, project_state)
-    active_project_task = None
+    session = ReplSession(
+        state=state,
+        key_store=key_store,
+        models=models,
+        current_model=current_model,
+        current_model_name=current_model_name,
+        ai_client=ai_client,
+        task_planner=TaskPlanner(ai_client),
+        project_state=project_state,
+        step_executor=StepExecutor(ai_client, project_state),
+    )
     
     # Show current model
     console.print(f"\n[dim]Current Model: {current_model_name}[/dim]")
-    console.print(f"[dim]Type \\ to open model/key menu[/dim]")
+    _print_status("Type \\ to open model/key menu", "dim")
     
     # Main interaction loop
     while True:
         console.print()
 
         # Cleanup finished background task
-        if active_project_task and active_project_task.done():
-            active_project_task = None
+        if session.active_project_task and session.active_project_task.done():
+            session.active_project_task = None
         
         # Display project name in prompt if active
+        step_executor = session.step_executor
         if step_executor.current_project_name:
             console.print(f"[bold #C8A882]{step_executor.current_project_name} User:[/bold #C8A882]", end=" ")
         else:
@@ -1223,242 +2247,29 @@ async def main():
         
         user_input = Prompt.ask("", console=console)
         
-        if user_input.lower() in ['quit', 'exit', 'q']:
+        if user_input.lower() in _QUIT_COMMANDS:
             console.print("[#C8A882]Goodbye![/#C8A882]")
             break
         
         if not user_input.strip():
             continue
 
-        # Stop/Abort running project
-        if user_input.lower() in ['stop', 'abort']:
-            if active_project_task and not active_project_task.done():
-                # Request stop and cancel the task
-                step_executor.request_stop()
-                try:
-                    await active_project_task
-                except asyncio.CancelledError:
-                    pass
-                active_project_task = None
-                # Also stop any background processes
-                try:
-                    res = await execute_safe_command_async("stop_all_processes")
-                    if res.get("success"):
-                        console.print(f"[dim]Stopped {res.get('count', 0)} background processes.[/dim]")
-                except Exception:
-                    pass
-                console.print("[bold yellow]Process stopped by user. Project state saved.[/bold yellow]")
-            else:
-                console.print("[dim]No running project to stop.[/dim]")
-            continue
-        
-        # Check if user wants to change model
-        if user_input.strip() == '\\':
-            # Open selection menu: list models or enter user API key
-            new_model = select_model(key_store, current_model)
-            current_model = new_model
-            
-            # Get model name for display
-            for model in models:
-                if model["id"] == current_model:
-                    current_model_name = model["name"]
-                    break
-            
-            # Reinitialize AI client with new model (and keep key_store)
-            ai_client = AIClient(current_model, key_store)
-            task_planner = TaskPlanner(ai_client)
-            step_executor = StepExecutor(ai_client, project_state)
-            
-            console.print(f"[green]✓ Model/anahtar güncellendi! Kullanılan model: {current_model_name}[/green]")
-            continue
-        
-        # Handle project management commands
-        if user_input.lower() == 'list':
-            projects = project_state.list_projects()
-            if not projects:
-                console.print("[#C8A882]No saved projects found.[/#C8A882]")
-            else:
-                table = Table(title="Saved Projects", border_style="#C8A882")
-                table.add_column("ID", style="#C8A882")
-                table.add_column("Name", style="green")
-                table.add_column("Status", style="yellow")
-                table.add_column("Progress", style="blue")
-                table.add_column("Substeps", style="magenta")
-                table.add_column("Created", style="dim")
-                
-                for proj in projects:
-                    table.add_row(
-                        proj["id"],
-                        proj["name"],
-                        proj["status"],
-                        f"{proj['current_step']}/{proj['total_steps']}",
-                        proj.get("subprogress", "-"),
-                        proj["created"]
-                    )
-                console.print(table)
-            continue
-        
-        if user_input.lower().startswith('resume '):
-            project_id = user_input[7:].strip()
-            saved_project = project_state.load_project(project_id)
-            if not saved_project:
-                console.print(f"[red]Project '{project_id}' not found.[/red]")
-            else:
-                if active_project_task and not active_project_task.done():
-                    console.print("[yellow]A project is already running. Type 'stop' to abort it before resuming another.[/yellow]")
-                else:
-                    active_project_task = asyncio.create_task(step_executor.execute_complex_task(
-                        saved_project["task_name"],
-                        saved_project["steps"],
-                        saved_project["original_input"],
-                        project_id=project_id
-                    ))
-                    console.print("[dim]Resumed project. Type 'stop' to abort.[/dim]")
-            continue
-        
-        if user_input.lower().startswith('delete '):
-            project_id = user_input[7:].strip()
-            if project_state.load_project(project_id):
-                confirm = Confirm.ask(f"[#C8A882]Delete project '{project_id}'?[/#C8A882]")
-                if confirm:
-                    project_state.delete_project(project_id)
-                    console.print(f"[green]Project '{project_id}' deleted.[/green]")
-            else:
-                console.print(f"[red]Project '{project_id}' not found.[/red]")
-            continue
-
-        # Process management commands
-        if user_input.lower() == 'ps':
-            try:
-                res = await execute_safe_command_async("list_processes")
-                if not res.get("success"):
-                    console.print(f"[red]Process list error: {res.get('error')}[/red]")
-                else:
-                    procs = res.get("processes", [])
-                    if not procs:
-                        console.print("[dim]No active processes.[/dim]")
-                    else:
-                        table = Table(title="Active Processes", border_style="#C8A882")
-                        table.add_column("PID", style="#C8A882")
-                        table.add_column("Command", style="green")
-                        table.add_column("CWD", style="blue")
-                        table.add_column("Started", style="dim")
-                        table.add_column("Status", style="yellow")
-                        table.add_column("Addresses", style="magenta")
-                        for p in procs:
-                            addrs = p.get("addresses") or []
-                            table.add_row(
-                                str(p.get("pid")),
-                                p.get("command", "-"),
-                                p.get("cwd", "-"),
-                                p.get("started_at", "-"),
-                                p.get("status", "-"),
-                                ", ".join(addrs) if addrs else "-",
-                            )
-                        console.print(table)
-            except Exception as e:
-                console.print(f"[red]ps failed: {e}[/red]")
-            continue
-
-        if user_input.lower().startswith('logs '):
-            parts = user_input.split()
-            pid = parts[1] if len(parts) > 1 else None
-            n = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 200
-            if not pid:
-                console.print("[yellow]Usage: logs <pid> [n][/yellow]")
-            else:
-                try:
-                    res = await execute_safe_command_async("tail_logs", pid=str(pid), n=n)
-                    if not res.get("success"):
-                        console.print(f"[red]Logs error: {res.get('error')}[/red]")
-                    else:
-                        lines = res.get("lines", [])
-                        out = "".join(lines)
-                        console.print(Panel(Markdown(f"```\n{out}\n```"), title=f"[bold #C8A882]Logs PID {pid}[/bold #C8A882]", border_style="#C8A882"))
-                except Exception as e:
-                    console.print(f"[red]Logs failed: {e}[/red]")
-            continue
-
-        if user_input.lower().startswith('launch '):
-            proj_id = user_input[7:].strip()
-            saved = project_state.load_project(proj_id)
-            if not saved:
-                console.print(f"[red]Project '{proj_id}' not found.[/red]")
-            else:
-                # Determine workspace
-                ws = saved.get("workspace")
-                if not ws:
-                    ws = str((BASE_DIR / "Workspace" / proj_id).resolve())
-                try:
-                    res = await execute_safe_command_async("launch_auto", cwd=ws)
-                    if res.get("success"):
-                        addrs = res.get("addresses") or []
-                        addr = addrs[0] if addrs else "(address pending)"
-                        console.print(f"[green]✓ Launched '{proj_id}' at {addr} (pid {res.get('pid')})[/green]")
-                    else:
-                        console.print(f"[yellow]Launch failed: {res.get('error')}[/yellow]")
-                except Exception as e:
-                    console.print(f"[red]Launch error: {e}[/red]")
-            continue
-
-        if user_input.lower().startswith('kill '):
-            pid = user_input[5:].strip()
-            try:
-                res = await execute_safe_command_async("stop_process", pid=str(pid))
-                if res.get("success"):
-                    console.print(f"[green]✓ Process {pid} stopped[/green]")
-                else:
-                    console.print(f"[yellow]Stop failed: {res.get('error')}[/yellow]")
-            except Exception as e:
-                console.print(f"[red]Stop error: {e}[/red]")
-            continue
-
-        if user_input.lower().startswith('restart '):
-            pid = user_input[8:].strip()
-            try:
-                res = await execute_safe_command_async("restart_process", pid=str(pid))
-                if res.get("success"):
-                    console.print(f"[green]✓ Process {pid} restarted (new pid {res.get('pid')})[/green]")
-                else:
-                    console.print(f"[yellow]Restart failed: {res.get('error')}[/yellow]")
-            except Exception as e:
-                console.print(f"[red]Restart error: {e}[/red]")
-            continue
-
-        if user_input.lower() == 'stop-all':
-            try:
-                res = await execute_safe_command_async("stop_all_processes")
-                if res.get("success"):
-                    console.print(f"[green]✓ Stopped {res.get('count', 0)} processes[/green]")
-                else:
-                    console.print(f"[yellow]Stop-all failed: {res.get('error')}[/yellow]")
-            except Exception as e:
-                console.print(f"[red]Stop-all error: {e}[/red]")
-            continue
-
-        if user_input.lower().startswith('runbg '):
-            cmd = user_input[6:].strip()
-            try:
-                res = await execute_safe_command_async("run_command_bg", command=cmd, cwd=str(Path.cwd()))
-                if res.get("success"):
-                    console.print(f"[green]✓ Started '{cmd}' (pid {res.get('pid')})[/green]")
-                else:
-                    console.print(f"[yellow]Background start failed: {res.get('error')}[/yellow]")
-            except Exception as e:
-                console.print(f"[red]Background run error: {e}[/red]")
+        handler, arg = _resolve_command(user_input)
+        if handler is not None:
+            await handler(session, arg)
             continue
         
         # Analyze task mode
         console.print()
-        analysis = await task_planner.analyze_task(user_input)
+        analysis = await session.task_planner.analyze_task(user_input)
         
         # Execute based on mode
         if analysis.get("mode") == "project" and analysis.get("steps"):
             # Project mode: step-by-step execution for both small and large tasks
-            if active_project_task and not active_project_task.done():
+            if session.active_project_task and not session.active_project_task.done():
                 console.print("[yellow]A project is already running. Type 'stop' to abort it before starting a new one.[/yellow]")
             else:
-                active_project_task = asyncio.create_task(
+                session.active_project_task = asyncio.create_task(
                     step_executor.execute_complex_task(
                         analysis.get("task_name") or "Project",
                         analysis["steps"],
@@ -1466,16 +2277,32 @@ async def main():
                         complexity_hint=analysis.get("complexity")
                     )
                 )
-                console.print("[dim]Project started. Type 'stop' to abort.[/dim]")
+                _print_status("Project started. Type 'stop' to abort.", "dim")
         else:
             # Conversation mode: quick direct response
             await step_executor.execute_simple_task(user_input)
 
+async def _run() -> None:
+    try:
+        await main()
+    finally:
+        await AIClient.aclose_clients()
+
+
+def _install_event_loop_policy() -> None:
+    """Use uvloop's faster event loop for sub-step fan-out when it is installed"""
+    try:
+        import uvloop
+    except ImportError:  # optional; not available on Windows
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 
 if __name__ == "__main__":
     import asyncio
+    _install_event_loop_policy()
     try:
-        asyncio.run(main())
+        asyncio.run(_run())
     except KeyboardInterrupt:
         console.print("\n[yellow]Interrupted by user. Goodbye![/yellow]")
         sys.exit(0)
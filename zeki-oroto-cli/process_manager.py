@@ -6,9 +6,11 @@ Background Process Manager for Oroto AI CLI
 """
 
 import asyncio
+import codecs
 import os
 import re
 import json
+import time
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -16,9 +18,26 @@ from asyncio.subprocess import PIPE
 from typing import Dict, Optional, List
 
 _REGISTRY: Dict[str, Dict] = {}
+# Project root -> (mtime signature, detect_project_type result)
+_DETECT_CACHE: Dict[str, tuple] = {}
 _LAST_PID: Optional[str] = None
 
 _URL_RE = re.compile(r"(https?://[\w\-\[\]\.:]+(?:/\S*)?)", re.IGNORECASE)
+# Bytes pulled from a pipe per read, buffered log size, and max seconds between log flushes
+_READ_CHUNK = 64 * 1024
+_LOG_BUFFER = 64 * 1024
+_LOG_FLUSH_INTERVAL = 0.5
+# Address discovery limits per process
+_MAX_ADDRESSES = 4
+_ADDRESS_SCAN_SECONDS = 60.0
+# Quoted package.json keys that detection looks at (scripts and dependencies)
+_PKG_KEYS = (b'"dev"', b'"start"', b'"vite"', b'"next"', b'"react-scripts"', b'"serve"')
+# Block size for reading logs backwards in tail_logs
+_TAIL_BLOCK = 8192
+# Seconds a process gets after SIGTERM (and again after SIGKILL) to exit
+_STOP_GRACE_SECONDS = 2.0
+# Stopped/exited processes kept in the registry for ps and logs
+_MAX_ENDED = 20
 _ALLOWED_PREFIXES = [
     "npm", "pnpm", "yarn", "npx", "pytest", "pip", "python",
     "node", "serve", "http-server", "uvicorn"
@@ -27,19 +46,20 @@ _ALLOWED_PREFIXES = [
 
 # Dynamically find an available local port for static servers
 def _find_available_port(start: int = 8000, end: int = 8010) -> int:
+    # Bind (without listening) on all interfaces: this fails for a port taken
+    # on any local address, and answers at once on every platform
     try:
         import socket
         for p in range(start, end + 1):
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if os.name != "nt":
+                    # Ignore TIME_WAIT leftovers; on Windows this flag would let
+                    # the bind succeed on a port that is actually in use
+                    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 try:
-                    s.bind(("127.0.0.1", p))
+                    s.bind(("", p))
                 except OSError:
                     continue
-                try:
-                    s.listen(1)
-                except Exception:
-                    pass
                 return p
     except Exception:
         pass
@@ -62,9 +82,31 @@ def _detect_package_manager(cwd: Path) -> str:
     return "npm"
 
 
+def _mtime_ns(path: Path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
 def detect_project_type(cwd: Optional[str] = None) -> Dict:
     """Detect project type and suggest launch command and patterns."""
     root = Path(cwd).resolve() if cwd else Path.cwd().resolve()
+    # The directory mtime covers files being added or removed; the others are
+    # the files whose contents decide the result
+    signature = tuple(_mtime_ns(p) for p in (root, root / "package.json", root / "app.py", root / "main.py"))
+    key = str(root)
+    cached = _DETECT_CACHE.get(key)
+    if cached and cached[0] == signature:
+        return {**cached[1], "addresses": []}
+    info = _detect_project_type(root)
+    # Static sites pick a free port at detection time, so they are not reused
+    if info.get("type") != "static":
+        _DETECT_CACHE[key] = (signature, info)
+    return {**info, "addresses": []}
+
+
+def _detect_project_type(root: Path) -> Dict:
     info = {
         "type": None,
         "command": None,
@@ -82,7 +124,9 @@ def detect_project_type(cwd: Optional[str] = None) -> Dict:
     pkg = root / "package.json"
     if pkg.exists():
         try:
-            data = json.loads(pkg.read_text(encoding="utf-8"))
+            raw = pkg.read_bytes()
+            # Only parse manifests that mention a key or dependency checked below
+            data = json.loads(raw) if any(k in raw for k in _PKG_KEYS) else {}
         except Exception:
             data = {}
         scripts = (data.get("scripts") or {})
@@ -145,27 +189,72 @@ def detect_project_type(cwd: Optional[str] = None) -> Dict:
     return info
 
 
+def _open_log(log_file: Path):
+    # One append-mode descriptor per process, shared by the stdout and stderr readers
+    fd = os.open(str(log_file), os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+    return os.fdopen(fd, "ab", buffering=_LOG_BUFFER)
+
+
+def _close_log(info: Dict) -> None:
+    log = info.get("_log")
+    if log is not None and not log.closed:
+        try:
+            log.close()
+        except Exception:
+            pass
+
+
+def _flush_log(info: Dict) -> None:
+    log = info.get("_log")
+    if log is not None and not log.closed:
+        try:
+            log.flush()
+        except Exception:
+            pass
+        info["_log_flushed"] = time.monotonic()
+
+
 async def _stream_and_log(stream, log_file: Path, buf: List[str], info: Dict):
+    # stdout and stderr share one buffered handle; the last stream to finish
+    # (or stop_process) closes it
+    log = info["_log"]
+    # Carries partial UTF-8 sequences over to the next chunk instead of dropping them
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
     try:
         while True:
-            chunk = await stream.read(1024)
+            chunk = await stream.read(_READ_CHUNK)
             if not chunk:
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    buf.append(tail)
                 break
-            text = chunk.decode(errors='ignore')
+            text = decoder.decode(chunk)
             buf.append(text)
             try:
-                with open(log_file, "a", encoding="utf-8", errors="ignore") as f:
-                    f.write(text)
+                log.write(chunk)
+                if time.monotonic() - info["_log_flushed"] >= _LOG_FLUSH_INTERVAL:
+                    _flush_log(info)
             except Exception:
                 pass
-            # Parse addresses
-            for m in _URL_RE.finditer(text):
-                url = m.group(1)
-                if url and url not in info["addresses"]:
-                    info["addresses"].append(url)
+            # Parse addresses; servers print them at startup, so stop looking
+            # once a few are known or the process has been up for a while
+            if (b"://" in chunk and len(info["addresses"]) < _MAX_ADDRESSES
+                    and time.monotonic() - info["_spawned"] < _ADDRESS_SCAN_SECONDS):
+                seen = info["_addr_set"]
+                for m in _URL_RE.finditer(text):
+                    url = m.group(1)
+                    if url and url not in seen:
+                        seen.add(url)
+                        info["addresses"].append(url)
     except Exception:
         # Swallow stream errors
         pass
+    finally:
+        info["_log_streams"] -= 1
+        if info["_log_streams"] <= 0:
+            _close_log(info)
+        else:
+            _flush_log(info)
 
 
 async def start_process(command: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None, name: Optional[str] = None, project_id: Optional[str] = None) -> Dict:
@@ -193,19 +282,25 @@ async def start_process(command: str, cwd: Optional[str] = None, env: Optional[D
         log_dir.mkdir(parents=True, exist_ok=True)
         log_file = log_dir / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.log"
 
-        run_env = os.environ.copy()
+        # None inherits the parent environment without copying it
+        run_env = None
         if env:
-            for k, v in env.items():
-                if isinstance(k, str) and isinstance(v, str):
-                    run_env[k] = v
-
-        proc = await asyncio.create_subprocess_shell(
-            command,
-            cwd=str(workdir),
-            stdout=PIPE,
-            stderr=PIPE,
-            env=run_env
-        )
+            run_env = {**os.environ, **{k: v for k, v in env.items() if isinstance(k, str) and isinstance(v, str)}}
+
+        # Open the log before spawning: if that fails, no child is left running
+        # outside _REGISTRY where stop_process could never reach it
+        log = _open_log(log_file)
+        try:
+            proc = await asyncio.create_subprocess_shell(
+                command,
+                cwd=str(workdir),
+                stdout=PIPE,
+                stderr=PIPE,
+                env=run_env
+            )
+        except BaseException:
+            log.close()
+            raise
 
         pid = uuid.uuid4().hex[:12]
         info = {
@@ -219,8 +314,14 @@ async def start_process(command: str, cwd: Optional[str] = None, env: Optional[D
             "exit_code": None,
             "status": "running",
             "addresses": [],
+            "_addr_set": set(),
+            "_spawned": time.monotonic(),
             "name": name or "process",
             "project_id": project_id,
+            "_env": env,
+            "_log": log,
+            "_log_flushed": time.monotonic(),
+            "_log_streams": 2,
         }
 
         stdout_buf: List[str] = []
@@ -229,6 +330,7 @@ async def start_process(command: str, cwd: Optional[str] = None, env: Optional[D
         t_err = asyncio.create_task(_stream_and_log(proc.stderr, log_file, stderr_buf, info))
 
         info["tasks"] = [t_out, t_err]
+        _reap_registry()
         _REGISTRY[pid] = info
         global _LAST_PID
         _LAST_PID = pid
@@ -245,6 +347,20 @@ async def start_process(command: str, cwd: Optional[str] = None, env: Optional[D
         return result
 
 
+async def _wait_exit(proc, timeout: float) -> bool:
+    """Wait up to timeout seconds for proc to exit; False if it is still running"""
+    try:
+        if hasattr(asyncio, "timeout"):
+            # Python 3.11+: a deadline on the current task, no wrapper task per wait
+            async with asyncio.timeout(timeout):
+                await proc.wait()
+        else:
+            await asyncio.wait_for(proc.wait(), timeout=timeout)
+        return True
+    except (asyncio.TimeoutError, TimeoutError):
+        return False
+
+
 async def stop_process(pid: str) -> Dict:
     info = _REGISTRY.get(pid)
     if not info:
@@ -256,13 +372,13 @@ async def stop_process(pid: str) -> Dict:
                 proc.terminate()
             except ProcessLookupError:
                 pass
-            try:
-                await asyncio.wait_for(proc.wait(), timeout=2)
-            except Exception:
+            if not await _wait_exit(proc, _STOP_GRACE_SECONDS):
+                # Escalate to SIGKILL and reap, so exit_code is recorded
                 try:
                     proc.kill()
-                except Exception:
+                except ProcessLookupError:
                     pass
+                await _wait_exit(proc, _STOP_GRACE_SECONDS)
         info["ended_at"] = datetime.now().isoformat()
         info["exit_code"] = getattr(proc, "returncode", None)
         info["status"] = "stopped" if info["exit_code"] is None else "exited"
@@ -272,6 +388,8 @@ async def stop_process(pid: str) -> Dict:
                 t.cancel()
             except Exception:
                 pass
+        # A reader cancelled before its first await never reaches its cleanup
+        _close_log(info)
         return {"success": True, "pid": pid, "status": info["status"], "exit_code": info["exit_code"]}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -283,11 +401,23 @@ async def restart_process(pid: str) -> Dict:
         return {"success": False, "error": f"Process not found: {pid}"}
     # Stop first
     await stop_process(pid)
-    # Start with same params
-    return await start_process(info["command"], cwd=info["cwd"], name=info.get("name"), project_id=info.get("project_id"))
+    # Start with same params. A fresh spawn (rather than reusing a parked
+    # process) is what makes the restart pick up code and config changes
+    return await start_process(info["command"], cwd=info["cwd"], env=info.get("_env"), name=info.get("name"), project_id=info.get("project_id"))
+
+
+def _reap_registry(max_ended: int = _MAX_ENDED) -> None:
+    # Drop the oldest ended entries so ps and stop-all don't grow with session length
+    ended = [(info.get("ended_at") or "", pid) for pid, info in _REGISTRY.items() if info.get("ended_at")]
+    if len(ended) <= max_ended:
+        return
+    ended.sort()
+    for _, pid in ended[:len(ended) - max_ended]:
+        _REGISTRY.pop(pid, None)
 
 
 async def list_processes() -> Dict:
+    _reap_registry()
     items = []
     for pid, info in list(_REGISTRY.items()):
         items.append({
@@ -304,6 +434,30 @@ async def list_processes() -> Dict:
     return {"success": True, "processes": items, "last_pid": _LAST_PID}
 
 
+def _tail_lines(path: Path, n: int) -> List[str]:
+    """Last n lines of a text file (all lines if n is falsy), reading back from the end"""
+    with open(path, "rb") as f:
+        if not n or n < 0:
+            data = f.read()
+        else:
+            pos = f.seek(0, os.SEEK_END)
+            blocks: List[bytes] = []
+            newlines = 0
+            # n + 1 newlines mean the n last lines are complete even with a trailing newline
+            while pos > 0 and newlines <= n:
+                step = min(_TAIL_BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                block = f.read(step)
+                blocks.append(block)
+                newlines += block.count(b"\n")
+            data = b"".join(reversed(blocks))
+    # Same line splitting as text-mode readlines()
+    text = data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+    lines = text.splitlines(keepends=True)
+    return lines[-n:] if n and len(lines) > n else lines
+
+
 async def tail_logs(pid: str, n: int = 200) -> Dict:
     info = _REGISTRY.get(pid)
     if not info:
@@ -311,23 +465,26 @@ async def tail_logs(pid: str, n: int = 200) -> Dict:
     log_path = Path(info.get("log_path"))
     if not log_path.exists():
         return {"success": False, "error": f"Log file missing: {log_path}"}
+    # Include output still sitting in the write buffer
+    _flush_log(info)
     try:
-        with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()
-        tail = lines[-n:] if n and len(lines) > n else lines
+        tail = _tail_lines(log_path, n)
         return {"success": True, "pid": pid, "log_path": str(log_path), "lines": tail}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
 async def stop_all_processes() -> Dict:
+    pids = list(_REGISTRY.keys())
+    # Each stop may wait up to 2s for its process, so stop them all at once
+    results = await asyncio.gather(*(stop_process(pid) for pid in pids), return_exceptions=True)
     errs = []
-    total = len(list(_REGISTRY.keys()))
-    for pid in list(_REGISTRY.keys()):
-        res = await stop_process(pid)
-        if not res.get("success"):
+    for pid, res in zip(pids, results):
+        if isinstance(res, BaseException):
+            errs.append(str(res) or f"Failed to stop {pid}")
+        elif not res.get("success"):
             errs.append(res.get("error") or f"Failed to stop {pid}")
-    return {"success": not errs, "errors": errs, "count": total - len(errs)}
+    return {"success": not errs, "errors": errs, "count": len(pids) - len(errs)}
 
 
 async def launch_auto(cwd: Optional[str] = None) -> Dict:
@@ -1,13 +1,13 @@
 import asyncio
-from pathlib import Path
 import pytest
 
 from process_manager import launch_auto, list_processes, stop_all_processes
 
 
 @pytest.mark.asyncio
-async def test_start_stop_static_project(tmp_path_factory):
-    ws_dir = Path.cwd() / "Workspace" / "test-static"
+async def test_start_stop_static_project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ws_dir = tmp_path / "Workspace" / "test-static"
     ws_dir.mkdir(parents=True, exist_ok=True)
     index = ws_dir / "index.html"
     index.write_text("<!doctype html><title>Test</title>", encoding="utf-8")
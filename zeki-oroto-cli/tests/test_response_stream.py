@@ -0,0 +1,57 @@
+import asyncio
+import sys
+import time
+import types
+
+import pytest
+
+# Shim httpx to avoid external dependency during tests
+class _DummyConfig:
+    def __init__(self, *args, **kwargs):
+        pass
+
+class _DummyClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+sys.modules.setdefault('httpx', types.SimpleNamespace(AsyncClient=_DummyClient, Client=_DummyClient, HTTPError=Exception, Timeout=_DummyConfig, Limits=_DummyConfig))
+
+from main import ResponseParser
+
+
+@pytest.mark.asyncio
+async def test_streamed_create_file_runs_before_stream_ends(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    body = "\n".join(f"line_{i} = {'x' * 60!r}" for i in range(1500))
+    reply = f"Here you go.\nCREATE_FILE: big.py\n```python\n{body}\n```\n" + "That is the whole module. " * 40
+    assert len(reply) > 100_000
+
+    sent = []
+    executed_after = []
+    real_execute = ResponseParser._execute_matches
+
+    async def recording_execute(results, matches):
+        matches = list(matches)
+        if matches:
+            executed_after.append(len(sent))
+        await real_execute(results, matches)
+    monkeypatch.setattr(ResponseParser, "_execute_matches", staticmethod(recording_execute))
+
+    async def chunks():
+        # Tiny chunks, like a token stream
+        for i in range(0, len(reply), 4):
+            sent.append(i)
+            yield reply[i:i + 4]
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    text, results = await ResponseParser.parse_and_execute_stream(chunks())
+    elapsed = time.perf_counter() - start
+
+    assert text == reply
+    assert not results["errors"]
+    assert (tmp_path / "big.py").read_text(encoding="utf-8").strip() == body
+    # The block was handed off while the trailing prose was still streaming
+    assert executed_after and executed_after[0] < len(sent)
+    # Scanning must stay linear in the reply size
+    assert elapsed < 5
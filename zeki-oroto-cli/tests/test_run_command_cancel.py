@@ -1,14 +1,14 @@
 import asyncio
-from pathlib import Path
 import pytest
 
 from commands import run_command_async
 
 
 @pytest.mark.asyncio
-async def test_run_command_cancel(tmp_path_factory):
-    # Create isolated workspace under current project
-    ws_dir = Path.cwd() / "Workspace" / "test-cancel"
+async def test_run_command_cancel(tmp_path, monkeypatch):
+    # Create isolated workspace under a temporary project root
+    monkeypatch.chdir(tmp_path)
+    ws_dir = tmp_path / "Workspace" / "test-cancel"
     ws_dir.mkdir(parents=True, exist_ok=True)
 
     # Long-running python command
@@ -31,4 +31,35 @@ async def test_run_command_cancel(tmp_path_factory):
     logs_dir = ws_dir / ".logs"
     assert logs_dir.exists(), "Logs directory should exist after command run"
     logs = list(logs_dir.glob("cmd-*.log"))
-    assert len(logs) >= 1, "A command log should be written"
\ No newline at end of file
+    assert len(logs) >= 1, "A command log should be written"
+
+@pytest.mark.asyncio
+async def test_run_command_timeout_keeps_partial_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    command = "python -c \"import time; print('partial-output', flush=True); time.sleep(5)\""
+
+    result = await run_command_async(command, timeout=1)
+
+    assert result["error"] == "Command timed out"
+    assert result["stdout"] == "partial-output\n"
+
+
+@pytest.mark.asyncio
+async def test_run_command_bounds_output_while_reading(tmp_path, monkeypatch):
+    import tracemalloc
+
+    monkeypatch.chdir(tmp_path)
+    command = "python -c \"import sys; sys.stdout.write('a' * 20_000_000)\""
+
+    tracemalloc.start()
+    try:
+        result = await run_command_async(command, max_head_bytes=4000, max_tail_bytes=4000)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert result["success"]
+    assert result["stdout"].startswith("a" * 4000)
+    assert "truncated" in result["stdout"]
+    # The 20 MB of output never sits in memory at once
+    assert peak < 5_000_000
@@ -5,6 +5,10 @@ import sys
 import types
 
 # Shim httpx to avoid external dependency during tests
+class _DummyConfig:
+    def __init__(self, *args, **kwargs):
+        pass
+
 class _DummyClient:
     def __init__(self, *args, **kwargs):
         pass
@@ -20,25 +24,30 @@ class _DummyClient:
                 return None
         return _Resp()
 
-sys.modules['httpx'] = types.SimpleNamespace(AsyncClient=_DummyClient, Client=_DummyClient, HTTPError=Exception)
+sys.modules['httpx'] = types.SimpleNamespace(AsyncClient=_DummyClient, Client=_DummyClient, HTTPError=Exception, Timeout=_DummyConfig, Limits=_DummyConfig)
 
+import main
 from main import StepExecutor, ProjectState, AIClient
 
 
 class FakeAI(AIClient):
     def __init__(self):
-        # Minimal placeholders; StepExecutor uses send_message only
-        self.model = "fake"
-        self.key_manager = None
+        # StepExecutor uses send_message and stream_message only; both are faked below
+        super().__init__("fake")
 
     async def send_message(self, messages, temperature=0.2):
         # Return a response that triggers a long-running command
         return "RUN: python -c \"import time,sys; sys.stdout.write('hello'); sys.stdout.flush(); time.sleep(5)\""
 
+    async def stream_message(self, messages, temperature=0.2):
+        yield await self.send_message(messages, temperature)
+
 
 @pytest.mark.asyncio
-async def test_mid_substep_cancellation_persists_state(tmp_path_factory):
-    # Setup project state and executor
+async def test_mid_substep_cancellation_persists_state(tmp_path, monkeypatch):
+    # Keep project state and the project workspace out of the package directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "BASE_DIR", tmp_path)
     project_state = ProjectState(project_dir=".cli_projects_test")
     ai = FakeAI()
     executor = StepExecutor(ai, project_state)
@@ -0,0 +1,147 @@
+import asyncio
+import copy
+import sys
+import threading
+import types
+
+import pytest
+
+# Shim httpx to avoid external dependency during tests
+class _DummyConfig:
+    def __init__(self, *args, **kwargs):
+        pass
+
+class _DummyClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+sys.modules.setdefault('httpx', types.SimpleNamespace(AsyncClient=_DummyClient, Client=_DummyClient, HTTPError=Exception, Timeout=_DummyConfig, Limits=_DummyConfig))
+
+import main
+from main import StepExecutor, ProjectState, AIClient
+
+
+class FakeAI(AIClient):
+    def __init__(self):
+        super().__init__("fake")
+
+    async def send_message(self, messages, temperature=0.2):
+        return "Done."
+
+    async def stream_message(self, messages, temperature=0.2):
+        yield await self.send_message(messages, temperature)
+
+
+@pytest.mark.asyncio
+async def test_every_step_runs_its_substeps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(main.Confirm, "ask", lambda *a, **k: True, raising=False)
+
+    async def no_launch(*args, **kwargs):
+        return {"success": False, "error": "disabled in tests"}
+    monkeypatch.setattr(main, "execute_safe_command_async", no_launch)
+
+    project_state = ProjectState(project_dir=str(tmp_path / "projects"))
+    saves = []
+    real_save = project_state.save_project_async
+
+    async def recording_save(project_id, data):
+        saves.append(copy.deepcopy(dict(data, memory=None)))
+        await real_save(project_id, data)
+    project_state.save_project_async = recording_save
+
+    executor = StepExecutor(FakeAI(), project_state)
+    ran = []
+
+    async def faux_generate(step_desc):
+        return [f"{step_desc} / a", f"{step_desc} / b"]
+    executor._generate_substeps = faux_generate
+
+    real_run = executor._run_substep
+
+    async def recording_run(i, j, sub, *args):
+        ran.append((i, j))
+        await real_run(i, j, sub, *args)
+    executor._run_substep = recording_run
+
+    await executor.execute_complex_task("Two Steps", ["first", "second"], original_input="", project_id="two_steps")
+
+    assert sorted(ran) == [(1, 1), (1, 2), (2, 1), (2, 2)]
+    assert set(saves[-1]["substeps_map"]) == {"1", "2"}
+    step_ends = [s["current_step"] for s in saves if s["current_step"] > 0]
+    assert step_ends[:2] == [1, 2]
+    assert project_state.load_project("two_steps")["status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_queued_substep_save_never_lands_after_step_end_save(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "_SAVE_DEBOUNCE", 0)
+    project_state = ProjectState(project_dir=str(tmp_path / "projects"))
+    executor = StepExecutor(FakeAI(), project_state)
+
+    # Hold the sub-step write on its worker thread until the step-end save is done
+    substep_writing = threading.Event()
+    substep_done = threading.Event()
+    release = threading.Event()
+    real_commit = project_state._commit
+
+    def slow_commit(project_id, payload, seq):
+        if b"substep" in payload:
+            substep_writing.set()
+            release.wait(5)
+            real_commit(project_id, payload, seq)
+            substep_done.set()
+        else:
+            real_commit(project_id, payload, seq)
+    project_state._commit = slow_commit
+
+    saver = asyncio.create_task(executor._saver_loop())
+    try:
+        executor._mark_dirty("ordering", {"phase": "substep"})
+        while not substep_writing.is_set():
+            await asyncio.sleep(0.01)
+        executor._drop_pending_save()
+        await project_state.save_project_async("ordering", {"phase": "step_end"})
+        release.set()
+        # Let the saver finish its late write
+        await asyncio.to_thread(substep_done.wait, 5)
+    finally:
+        release.set()
+        saver.cancel()
+
+    assert project_state.load_project("ordering") == {"phase": "step_end"}
+
+
+@pytest.mark.asyncio
+async def test_exception_mid_step_flushes_pending_substep_save(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(main.Confirm, "ask", lambda *a, **k: True, raising=False)
+
+    class FailingAI(FakeAI):
+        calls = 0
+
+        async def stream_message(self, messages, temperature=0.2):
+            FailingAI.calls += 1
+            if FailingAI.calls > 1:
+                raise RuntimeError("model went away")
+            yield "Done."
+
+    project_state = ProjectState(project_dir=str(tmp_path / "projects"))
+    executor = StepExecutor(FailingAI(), project_state)
+    executor.max_concurrency = 1
+
+    async def faux_generate(step_desc):
+        return [f"{step_desc} / a", f"{step_desc} / b"]
+    executor._generate_substeps = faux_generate
+
+    with pytest.raises(RuntimeError):
+        await executor.execute_complex_task("Fails Midway", ["only"], original_input="", project_id="fails_midway")
+
+    # Sub-step 1 finished well inside the saver's debounce window, so only the
+    # flush on the way out can have written it
+    data = project_state.load_project("fails_midway")
+    assert data["current_substep"] == 1
+    assert data["status"] == "in_progress"
+    assert executor._pending_save is None